@@ -1,5 +1,12 @@
+import hmac
+import json
+
 import frappe
 from cron_descriptor import get_description
+from frappe.utils import cint
+from gspread.utils import extract_id_from_url
+
+from sheets.webhook import WEBHOOK_SECRET_HEADER, queue_notified_rows
 
 CRON_MAP = {
     "Yearly": "0 0 1 1 *",
@@ -20,3 +27,66 @@ def describe_cron(cron: str):
     if cron in CRON_MAP:
         cron = CRON_MAP[cron]
     return get_description(cron)
+
+
+@frappe.whitelist(methods=["GET"])
+def get_sync_logs(spreadsheet: str, limit: int = 20):
+    frappe.get_doc("SpreadSheet", spreadsheet).check_permission("read")
+    sync_logs = frappe.get_all(
+        "SpreadSheet Sync Log",
+        filters={"spreadsheet": spreadsheet},
+        fields=["*"],
+        order_by="creation desc",
+        limit=cint(limit),
+    )
+    for sync_log in sync_logs:
+        sync_log.worksheet_stats = json.loads(sync_log.worksheet_stats or "[]")
+    return sync_logs
+
+
+@frappe.whitelist(methods=["POST"])
+def profile_sync(spreadsheet: str):
+    """Runs a forced, profiled import of the SpreadSheet & returns its SpreadSheet Sync Log"""
+    doc = frappe.get_doc("SpreadSheet", spreadsheet)
+    doc.check_permission("write")
+    doc.trigger_import(force=True, profile=True)
+    if doc.flags.sync_skipped:
+        frappe.throw("The sheet is already being synced, profile it once that's done.")
+    return frappe.get_doc("SpreadSheet Sync Log", doc.flags.sync_log)
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def notify_changes(spreadsheet_id: str, worksheet_id: int, rows: list[int]):
+    """Webhook for row level changes of a worksheet, eg: from an Apps Script `onEdit` trigger.
+    Takes the Google Sheets ID of the spreadsheet, the worksheet's ID (gid) & the numbers of the
+    edited rows, authenticated by the SpreadSheet's Webhook Secret sent in the
+    X-Sheets-Webhook-Secret header. The rows are queued & imported once the edits settle."""
+    spreadsheet = get_spreadsheet_by_id(spreadsheet_id)
+    webhook_secret = spreadsheet and spreadsheet.get_password(
+        "webhook_secret", raise_exception=False
+    )
+    if not webhook_secret or not hmac.compare_digest(
+        frappe.get_request_header(WEBHOOK_SECRET_HEADER) or "", webhook_secret
+    ):
+        raise frappe.PermissionError
+
+    if not (worksheets := spreadsheet.get("worksheet_ids", {"worksheet_id": cint(worksheet_id)})):
+        frappe.throw(f"Worksheet {worksheet_id} isn't mapped", exc=frappe.DoesNotExistError)
+
+    # the header row isn't imported
+    row_numbers = {x for x in map(cint, frappe.parse_json(rows)) if x > 1}
+    if row_numbers:
+        queue_notified_rows(worksheets[0].name, sorted(row_numbers))
+
+    return {"queued": len(row_numbers)}
+
+
+def get_spreadsheet_by_id(spreadsheet_id: str):
+    for name, sheet_url in frappe.get_all(
+        "SpreadSheet",
+        filters={"sheet_url": ("like", f"%{spreadsheet_id}%")},
+        fields=["name", "sheet_url"],
+        as_list=True,
+    ):
+        if extract_id_from_url(sheet_url) == spreadsheet_id:
+            return frappe.get_doc("SpreadSheet", name)
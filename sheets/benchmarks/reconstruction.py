@@ -0,0 +1,118 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+"""Compares the nested-loop update replay used to reconstruct imported worksheet data against
+the ID indexed replay in `sheets.diff.replay_imports`.
+
+Usage: python -m sheets.benchmarks.reconstruction [rows ...]
+"""
+
+import random
+import sys
+import time
+from csv import reader as csv_reader
+from csv import writer as csv_writer
+from io import StringIO
+
+from sheets.diff import replay_imports
+
+DEFAULT_SIZES = (1_000, 5_000, 20_000)
+INSERT_IMPORTS = 10
+UPDATE_IMPORTS = 50
+UPDATES_PER_IMPORT = 0.002
+HEADER = ["ID", "Title", "Qty"]
+
+
+def to_csv(rows) -> str:
+    buffer = StringIO()
+    csv_writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def generate_imports(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = [[f"ROW-{i:07d}", f"Item {i}", str(rng.randint(1, 100))] for i in range(size)]
+    chunk_size = -(-size // INSERT_IMPORTS)
+
+    insert_csvs = [
+        to_csv([HEADER, *rows[idx : idx + chunk_size]]) for idx in range(0, size, chunk_size)
+    ]
+    update_csvs = [
+        to_csv(
+            [HEADER]
+            + [
+                [f"ROW-{i:07d}", f"Item {i}", str(rng.randint(1, 100))]
+                for i in rng.sample(range(size), max(1, int(size * UPDATES_PER_IMPORT)))
+            ]
+        )
+        for _ in range(UPDATE_IMPORTS)
+    ]
+
+    return insert_csvs, update_csvs
+
+
+def nested_loop_replay(insert_csvs, update_csvs, id_field):
+    # the update replay as it was before being indexed on the ID column
+    data_imported_csv_file = []
+    for csv_file in insert_csvs:
+        rows = list(csv_reader(StringIO(csv_file)))
+        data_imported_csv_file.extend(rows if not data_imported_csv_file else rows[1:])
+
+    id_field_imported_index = data_imported_csv_file[0].index(id_field)
+
+    for csv_file in update_csvs:
+        update_csv_reader = csv_reader(StringIO(csv_file))
+        id_field_index = next(update_csv_reader).index(id_field)
+
+        for update_row in update_csv_reader:
+            for idx, data_row in enumerate(data_imported_csv_file):
+                if update_row[id_field_index] == data_row[id_field_imported_index]:
+                    data_imported_csv_file[idx] = update_row
+                    continue
+
+    return data_imported_csv_file
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes=DEFAULT_SIZES):
+    results = []
+
+    for size in sizes:
+        insert_csvs, update_csvs = generate_imports(size)
+        loop_time, loop_rows = timed(nested_loop_replay, insert_csvs, update_csvs, "ID")
+        index_time, index_rows = timed(replay_imports, insert_csvs, update_csvs, "ID")
+        results.append(
+            {
+                "rows": size,
+                "update_rows": sum(len(x.splitlines()) - 1 for x in update_csvs),
+                "nested_loop": loop_time,
+                "indexed": index_time,
+                "matches": loop_rows == index_rows,
+            }
+        )
+
+    return results
+
+
+def main(argv=None):
+    sizes = [int(x) for x in (argv or sys.argv[1:])] or DEFAULT_SIZES
+
+    print(
+        f"{'rows':>10} {'update rows':>12} {'nested loop (s)':>16} {'indexed (s)':>12} "
+        f"{'speedup':>9} {'matches':>8}"
+    )
+    for result in run(sizes):
+        print(
+            f"{result['rows']:>10} {result['update_rows']:>12} {result['nested_loop']:>16.4f} "
+            f"{result['indexed']:>12.4f} {result['nested_loop'] / result['indexed']:>8.1f}x "
+            f"{result['matches']!s:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
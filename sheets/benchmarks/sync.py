@@ -0,0 +1,296 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+"""Benchmarks SpreadSheet.trigger_import end to end, from fetching the worksheet to running its
+Data Imports, against an in-memory stand-in for the Sheets API.
+
+Three runs are measured per size: "insert" imports a new worksheet, "append" the rows added to
+it afterwards & "upsert" the rows edited in place, after switching the mapping to Upsert. Each
+run reports the rows imported per second, the peak memory traced & the API calls made.
+
+Needs a site, the records & documents created are deleted afterwards:
+
+    bench --site test_site execute sheets.benchmarks.sync.main --kwargs "{'sizes': [10000]}"
+"""
+
+import json
+import random
+import re
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import frappe
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import absolute_range_name
+
+from sheets.importer import start_import
+from sheets.profiling import instrument_request
+from sheets.sheets_workspace.doctype.worksheet_row_fingerprint.worksheet_row_fingerprint import (
+    clear_row_fingerprints,
+)
+
+DEFAULT_SIZES = (1_000, 10_000)
+CHURN = 0.01
+BENCHMARK_DOCTYPE = "Sheets Benchmark Record"
+SHEET_KEY = "sheets-benchmark"
+SHEET_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_KEY}/edit"
+WORKSHEET_ID = 0
+HEADER = ["Record ID", "Title", "Qty"]
+
+# empty rows below the data, as in worksheets created through the Sheets UI
+EMPTY_ROWS = 100
+
+
+class FakeResponse:
+    def __init__(self, payload: dict):
+        self.content = json.dumps(payload).encode("utf-8")
+
+    def json(self) -> dict:
+        return json.loads(self.content)
+
+
+class FakeClient:
+    """Serves the gspread calls made during a sync from an in-memory worksheet. Every call that
+    makes an HTTP request with gspread goes through `request`, instrumented like the real
+    client's, so the API calls & bytes recorded match those of a real sync."""
+
+    def __init__(self, rows: list[list[str]]):
+        self.rows = rows
+        self.modified_time = frappe.utils.now_datetime().isoformat()
+        self.request = instrument_request(self.request)
+
+    def request(self, method: str, endpoint: str, params: dict | None = None, **kwargs):
+        params = params or {}
+
+        if endpoint.startswith(DRIVE_FILES_API_V3_URL):
+            payload = {"modifiedTime": self.modified_time}
+        elif endpoint == "values:batchGet":
+            payload = {"valueRanges": [{"values": self.get_values(x)} for x in params["ranges"]]}
+        elif endpoint == "values":
+            payload = {"values": self.get_values(params["range"])}
+        else:
+            payload = {"sheets": [{"properties": {"sheetId": WORKSHEET_ID}}]}
+
+        return FakeResponse(payload)
+
+    def get_values(self, range_name: str) -> list[list[str]]:
+        # trailing empty cells & rows are left out, like the API does
+        start_row, end_row = map(int, re.findall(r"[A-Z]+(\d+)", range_name.split("!")[-1]))
+        values = [trim_row(row) for row in self.rows[start_row - 1 : end_row]]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def open_by_url(self, url: str) -> "FakeSpreadsheet":
+        self.request("get", "spreadsheets")
+        return FakeSpreadsheet(self)
+
+    def touch(self):
+        self.modified_time = frappe.utils.now_datetime().isoformat()
+
+
+class FakeSpreadsheet:
+    title = "Sheets Benchmark"
+
+    def __init__(self, client: FakeClient):
+        self.client = client
+
+    def worksheets(self) -> list["FakeWorksheet"]:
+        self.client.request("get", "spreadsheets")
+        return [FakeWorksheet(self.client)]
+
+    def values_batch_get(self, ranges: list[str]) -> dict:
+        return self.client.request("get", "values:batchGet", params={"ranges": ranges}).json()
+
+
+class FakeWorksheet:
+    id = WORKSHEET_ID
+    title = "Sheet1"
+
+    def __init__(self, client: FakeClient):
+        self.client = client
+        self.row_count = len(client.rows) + EMPTY_ROWS
+        self.col_count = len(HEADER)
+
+    def get_values(self, range_name: str) -> list[list[str]]:
+        range_name = absolute_range_name(self.title, range_name)
+        values = self.client.request("get", "values", params={"range": range_name}).json()
+        # gspread pads the rows to the same length
+        width = max((len(row) for row in values["values"]), default=0)
+        return [row + [""] * (width - len(row)) for row in values["values"]]
+
+
+def trim_row(row: list[str]) -> list[str]:
+    row = list(row)
+    while row and not row[-1]:
+        row.pop()
+    return row
+
+
+def generate_rows(start: int, count: int, rng: random.Random) -> list[list[str]]:
+    return [
+        [f"REC-{idx:07d}", f"Item {idx}", str(rng.randint(1, 100))]
+        for idx in range(start, start + count)
+    ]
+
+
+def make_benchmark_doctype():
+    if frappe.db.exists("DocType", BENCHMARK_DOCTYPE):
+        return
+
+    frappe.get_doc(
+        {
+            "doctype": "DocType",
+            "name": BENCHMARK_DOCTYPE,
+            "module": "Sheets Workspace",
+            "custom": 1,
+            "autoname": "field:record_id",
+            "fields": [
+                {
+                    "fieldname": "record_id",
+                    "label": "Record ID",
+                    "fieldtype": "Data",
+                    "unique": 1,
+                    "reqd": 1,
+                },
+                {"fieldname": "title", "label": "Title", "fieldtype": "Data"},
+                {"fieldname": "qty", "label": "Qty", "fieldtype": "Int"},
+            ],
+            "permissions": [
+                {
+                    "role": "System Manager",
+                    "read": 1,
+                    "write": 1,
+                    "create": 1,
+                    "delete": 1,
+                    "import": 1,
+                }
+            ],
+        }
+    ).insert()
+
+
+def make_spreadsheet(client: FakeClient):
+    spreadsheet = frappe.new_doc("SpreadSheet")
+    # an instance attribute, other SpreadSheets keep using the real client
+    spreadsheet.get_sheet_client = lambda: client
+    spreadsheet.sheet_url = SHEET_URL
+    spreadsheet.append(
+        "worksheet_ids",
+        {
+            "worksheet_id": WORKSHEET_ID,
+            "mapped_doctype": BENCHMARK_DOCTYPE,
+            "import_type": "Insert",
+        },
+    )
+    return spreadsheet.insert()
+
+
+def run_data_imports(data_imports: list[str]) -> float:
+    """Runs the Data Imports queued by the sync in process & returns the time taken"""
+    # ends the sync like its job does, which releases its lock
+    frappe.db.commit()
+    start = time.perf_counter()
+
+    for data_import in data_imports:
+        start_import(data_import)
+
+    return time.perf_counter() - start
+
+
+def measure(spreadsheet, run: str, measure_memory: bool = True) -> dict:
+    if measure_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    # the imports are run in process instead of by workers, once the sync is done
+    with patch("frappe.enqueue_doc") as enqueue_doc:
+        spreadsheet.trigger_import()
+    sync_time = time.perf_counter() - start
+    import_time = run_data_imports([x.args[1] for x in enqueue_doc.call_args_list])
+
+    peak_memory = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    if measure_memory:
+        tracemalloc.stop()
+
+    sync_log = frappe.get_doc("SpreadSheet Sync Log", spreadsheet.flags.sync_log)
+    return {
+        "run": run,
+        "rows": sync_log.rows_written,
+        "sync": sync_time,
+        "import": import_time,
+        "rows_per_second": sync_log.rows_written / (sync_time + import_time),
+        "peak_memory": peak_memory,
+        "api_calls": sync_log.api_calls,
+        "bytes_fetched": sync_log.bytes_fetched,
+    }
+
+
+def cleanup(spreadsheet):
+    for data_import in frappe.get_all(
+        "Data Import", filters={"spreadsheet_id": spreadsheet.name}, pluck="name"
+    ):
+        frappe.db.delete("Data Import Log", {"data_import": data_import})
+        frappe.delete_doc("Data Import", data_import, force=True, ignore_permissions=True)
+
+    for worksheet in spreadsheet.worksheet_ids:
+        clear_row_fingerprints(worksheet.name)
+    frappe.db.delete("SpreadSheet Sync Log", {"spreadsheet": spreadsheet.name})
+    frappe.delete_doc("SpreadSheet", spreadsheet.name, force=True, ignore_permissions=True)
+    frappe.db.delete(BENCHMARK_DOCTYPE)
+    frappe.db.commit()
+
+
+def delete_benchmark_doctype():
+    frappe.delete_doc("DocType", BENCHMARK_DOCTYPE, force=True, ignore_missing=True)
+    frappe.db.commit()
+
+
+def run(sizes=DEFAULT_SIZES, churn: float = CHURN, measure_memory: bool = True, seed: int = 0):
+    make_benchmark_doctype()
+    results = []
+
+    for size in sizes:
+        rng = random.Random(seed)
+        client = FakeClient([HEADER, *generate_rows(0, size, rng)])
+        spreadsheet = make_spreadsheet(client)
+        # the Data Imports commit as they run, the benchmark's documents are deleted in cleanup
+        frappe.db.commit()
+        changes = max(1, int(size * churn))
+
+        try:
+            results.append({"size": size, **measure(spreadsheet, "insert", measure_memory)})
+
+            client.rows.extend(generate_rows(size, changes, rng))
+            client.touch()
+            results.append({"size": size, **measure(spreadsheet, "append", measure_memory)})
+
+            # counters are advanced by the imports, in the database
+            spreadsheet.reload()
+            spreadsheet.worksheet_ids[0].import_type = "Upsert"
+            spreadsheet.save()
+            for row in rng.sample(client.rows[1:], changes):
+                row[2] = str(int(row[2]) + 1)
+            client.touch()
+            results.append({"size": size, **measure(spreadsheet, "upsert", measure_memory)})
+        finally:
+            cleanup(spreadsheet)
+
+    return results
+
+
+def main(sizes=None, churn: float = CHURN, measure_memory: bool = True):
+    print(
+        f"{'size':>8} {'run':>7} {'rows':>7} {'sync (s)':>9} {'import (s)':>11} {'rows/s':>9} "
+        f"{'peak (MiB)':>11} {'API calls':>10} {'KiB fetched':>12}"
+    )
+    for result in run(sizes or DEFAULT_SIZES, churn, measure_memory):
+        peak_memory = (
+            f"{result['peak_memory'] / 2**20:>11.1f}" if result["peak_memory"] else f"{'-':>11}"
+        )
+        print(
+            f"{result['size']:>8} {result['run']:>7} {result['rows']:>7} {result['sync']:>9.3f} "
+            f"{result['import']:>11.3f} {result['rows_per_second']:>9.0f} {peak_memory} "
+            f"{result['api_calls']:>10} {result['bytes_fetched'] / 2**10:>12.1f}"
+        )
@@ -0,0 +1,64 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+from threading import Lock
+from typing import TYPE_CHECKING
+
+import frappe
+import gspread as gs
+from requests.adapters import HTTPAdapter
+
+import sheets
+from sheets.profiling import instrument_request
+
+if TYPE_CHECKING:
+    from frappe.core.doctype.file import File
+
+# connections kept alive per host in the shared client session
+CONNECTION_POOL_SIZE = 10
+
+# clients are shared by all the jobs & requests served by this process. The google-auth
+# credentials of a client hold its access token & refresh it only once it's expired.
+_sheet_clients: dict[tuple[str, str, str], gs.Client] = {}
+_sheet_clients_lock = Lock()
+
+
+def get_credentials_file() -> "File":
+    return frappe.get_cached_doc(
+        "File",
+        {
+            "attached_to_doctype": sheets.SHEETS_SETTINGS,
+            "attached_to_name": sheets.SHEETS_SETTINGS,
+            "attached_to_field": sheets.SHEETS_CREDENTIAL_FIELD,
+        },
+    )
+
+
+def get_sheet_client() -> gs.Client:
+    """Returns the process wide client for the current site's service account credentials"""
+    file = get_credentials_file()
+    # a changed or replaced credential file misses the cache, across all workers
+    cache_key = (frappe.local.site, file.name, file.content_hash or str(file.modified))
+
+    with _sheet_clients_lock:
+        if (client := _sheet_clients.get(cache_key)) is None:
+            _clear_site_clients(frappe.local.site)
+            client = gs.service_account(file.get_full_path())
+            adapter = HTTPAdapter(
+                pool_connections=CONNECTION_POOL_SIZE, pool_maxsize=CONNECTION_POOL_SIZE
+            )
+            client.session.mount("https://", adapter)
+            client.request = instrument_request(client.request)
+            _sheet_clients[cache_key] = client
+
+    return client
+
+
+def clear_sheet_client_cache():
+    with _sheet_clients_lock:
+        _clear_site_clients(frappe.local.site)
+
+
+def _clear_site_clients(site: str):
+    for cache_key in [x for x in _sheet_clients if x[0] == site]:
+        _sheet_clients.pop(cache_key).session.close()
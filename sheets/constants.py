@@ -1,3 +1,53 @@
 from frappe.core.doctype.data_import.importer import INSERT, UPDATE  # noqa: F401
 
 UPSERT = "Update Existing Records or Insert New Records"
+
+# rows fetched per request when paging through a remote worksheet
+FETCH_BATCH_SIZE = 5_000
+
+# worksheets of a SpreadSheet fetched & diffed concurrently during an import
+IMPORT_WORKERS = 4
+
+# data rows per Data Import when splitting a worksheet's new rows into chunks
+IMPORT_CHUNK_SIZE = 10_000
+
+# most shards the rows updated by an Upsert are split into, by row key, each shard is imported
+# by its own Data Import & job
+UPDATE_SHARDS = 4
+
+# rows per update shard below which the rows aren't split any further
+UPDATE_SHARD_MIN_ROWS = 1_000
+
+# days the import files of a worksheet are kept before they're compacted into its baseline file
+SNAPSHOT_RETENTION_DAYS = 30
+
+# most scheduled syncs running at once across all SpreadSheets, see `sheets.scheduler`
+MAX_CONCURRENT_SYNCS = 4
+
+# unchanged syncs in a row after which a sheet's polling stops slowing down any further, each
+# one doubles the gap between its polls
+MAX_POLL_BACKOFF = 3
+
+# the backoff delays a poll by less than this many seconds past its scheduled time, so sheets on
+# a frequency of an hour or more are always polled on time
+MAX_POLL_DELAY = 3_600
+
+# seconds a poll is delayed by at most, at random, so that sheets on the same frequency don't all
+# sync at the same tick
+SYNC_JITTER = 300
+
+# seconds without new notifications after which the rows notified for a worksheet are imported
+WEBHOOK_DEBOUNCE = 5
+
+# seconds the import of notified rows waits at most for the notifications to settle
+WEBHOOK_MAX_DELAY = 30
+
+# characters of an import error written back to a row's status cell
+STATUS_MESSAGE_LENGTH = 200
+
+# seconds a sync holds the lock of its SpreadSheet without renewing it, the lock of a worker that
+# died is released after this. It's renewed as the sync moves through its states.
+SYNC_LEASE = 1_800
+
+# seconds the state of a finished sync is kept for
+SYNC_STATE_TTL = 86_400
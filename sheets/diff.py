@@ -0,0 +1,142 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+from csv import reader as csv_reader
+from hashlib import md5
+from io import StringIO
+from typing import Any, Callable, Iterable, NamedTuple, Sequence
+
+Row = Sequence[str]
+
+
+class RowDiff(NamedTuple):
+    inserted: list[Row]
+    changed: list[Row]
+    # only counted, unchanged rows are most of a worksheet & aren't imported
+    unchanged: int
+
+
+def get_content_length(row: Row) -> int:
+    """Returns the number of cells of `row` up to its last non-empty one, 0 for empty rows"""
+    length = len(row)
+    while length and not row[length - 1]:
+        length -= 1
+    return length
+
+
+def hash_row(row: Row, length: int | None = None) -> str:
+    # trailing empty cells are dropped so that a worksheet growing new (empty) columns
+    # doesn't mark every row as changed
+    if length is None:
+        length = get_content_length(row)
+    cells = row if length == len(row) else row[:length]
+    return md5("\x1f".join(cells).encode("utf-8")).hexdigest()
+
+
+def get_row_key(row: Row, id_index: int, row_hash: str) -> str:
+    # rows without an ID are keyed by their content, so an identical row is still seen as unchanged
+    if id_index < len(row) and row[id_index]:
+        return row[id_index]
+    return f"#{row_hash}"
+
+
+def get_row_shard(row: Row, id_index: int, shard_count: int) -> int:
+    """Returns the shard `row` belongs to by its key. It's the same for all the rows of a key & in
+    every process, unlike hash()."""
+    row_key = get_row_key(row, id_index, hash_row(row))
+    return int(md5(row_key.encode("utf-8")).hexdigest()[:8], 16) % shard_count
+
+
+def is_empty_row(row: Row) -> bool:
+    return not any(row)
+
+
+def fingerprint_rows(rows: Iterable[Row], id_index: int) -> dict[str, str]:
+    """Returns a mapping of row key -> content hash for the given rows (header excluded)"""
+    fingerprints = {}
+
+    for row in rows:
+        if length := get_content_length(row):
+            row_hash = hash_row(row, length)
+            fingerprints[get_row_key(row, id_index, row_hash)] = row_hash
+
+    return fingerprints
+
+
+def diff_rows(
+    previous: dict[str, str],
+    rows: Iterable,
+    id_index: int,
+    get_row: Callable[[Any], Row] | None = None,
+) -> RowDiff:
+    """Compares `rows` against the fingerprints of a previous state in a single pass.
+
+    `previous` is a mapping of row key -> content hash, as generated by `fingerprint_rows`.
+    Rows whose key isn't found in `previous` are reported as inserted, rows whose content
+    hash differs as changed, while unchanged rows are only counted so that memory is bounded by
+    the changes. With `get_row`, `rows` are items holding a row, eg: along with its row number,
+    which are reported as is.
+    """
+    inserted, changed, unchanged = [], [], 0
+
+    for item in rows:
+        row = get_row(item) if get_row else item
+        # the content length tells empty rows apart & is reused to hash the row
+        if not (length := get_content_length(row)):
+            continue
+
+        row_hash = hash_row(row, length)
+        previous_hash = previous.get(get_row_key(row, id_index, row_hash))
+
+        if previous_hash is None:
+            inserted.append(item)
+        elif previous_hash != row_hash:
+            changed.append(item)
+        else:
+            unchanged += 1
+
+    return RowDiff(inserted, changed, unchanged)
+
+
+def replay_imports(
+    insert_csvs: Iterable[str], update_csvs: Iterable[str], id_field: str
+) -> list[list[str]]:
+    """Reconstructs the imported state of a worksheet, header included.
+
+    Rows of the INSERT csvs are concatenated in order of import & rows of the UPDATE csvs are
+    then applied over them, matched by the `id_field` column through an index on it.
+    """
+    imported_rows = []
+
+    for csv_file in insert_csvs:  # order of imports (first to last)
+        insert_csv_reader = csv_reader(StringIO(csv_file))
+        header_row = next(insert_csv_reader, None)
+        if header_row is None:
+            continue
+        if not imported_rows:
+            imported_rows.append(header_row)
+        imported_rows.extend(insert_csv_reader)
+
+    if not imported_rows:
+        return imported_rows
+
+    id_field_index = imported_rows[0].index(id_field)
+    row_index: dict[str, list[int]] = {}
+    for idx, row in enumerate(imported_rows[1:], start=1):
+        if id_field_index < len(row) and row[id_field_index]:
+            row_index.setdefault(row[id_field_index], []).append(idx)
+
+    for csv_file in update_csvs:
+        update_csv_reader = csv_reader(StringIO(csv_file))
+        header_row = next(update_csv_reader, None)
+        if header_row is None:
+            continue
+        update_id_field_index = header_row.index(id_field)
+
+        for update_row in update_csv_reader:
+            if update_id_field_index >= len(update_row):
+                continue
+            for idx in row_index.get(update_row[update_id_field_index], ()):
+                imported_rows[idx] = update_row
+
+    return imported_rows
@@ -65,6 +65,7 @@ app_license = "No License"
 
 # before_install = "sheets.install.before_install"
 after_install = "sheets.install.after_install"
+after_migrate = "sheets.install.after_migrate"
 
 # Uninstallation
 # ------------
@@ -98,15 +99,28 @@ has_permission = {
 # 	"ToDo": "custom_app.overrides.CustomToDo"
 # }
 
+override_doctype_class = {"Data Import": "sheets.overrides.SheetsDataImport"}
+
 # Document Events
 # ---------------
 # Hook on document methods and events
 
 doc_events = {}
 
+# Log Clearing
+# ------------
+# DocTypes cleared by Log Settings, with the number of days logs are kept
+
+default_log_clearing_doctypes = {"SpreadSheet Sync Log": 30}
+
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+    "all": ["sheets.scheduler.dispatch_syncs"],
+    "daily_long": ["sheets.tasks.compact_worksheet_imports"],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"sheets.tasks.all"
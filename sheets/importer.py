@@ -0,0 +1,478 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+import json
+import unicodedata
+from functools import cached_property
+
+import frappe
+from frappe import _
+from frappe.core.doctype.data_import.importer import (
+    INVALID_VALUES,
+    Importer,
+    get_diff,
+    get_id_field,
+)
+from frappe.model.base_document import get_controller
+from frappe.model.document import Document
+from frappe.utils import cint, cstr
+
+from sheets.constants import INSERT
+
+# rows validated & written per multi-row INSERT in bulk imports
+BULK_INSERT_CHUNK_SIZE = 500
+
+# records looked up per query when prefetching existing records for an update import
+EXISTING_RECORDS_CHUNK_SIZE = 500
+
+# controller methods that disqualify a DocType from bulk imports, as they'd be skipped
+CONTROLLER_METHODS = (
+    "autoname",
+    "before_naming",
+    "before_insert",
+    "before_validate",
+    "validate",
+    "before_save",
+    "after_insert",
+    "on_update",
+    "on_change",
+)
+
+# records acting on the documents of the DocType they reference as they're inserted, which bulk
+# imports would skip: (DocType, field referencing the DocType, filters of active records)
+DOCTYPE_CONFIGURATIONS = (
+    ("Notification", "document_type", {"enabled": 1}),
+    ("Webhook", "webhook_doctype", {"enabled": 1}),
+    ("Assignment Rule", "document_type", {"disabled": 0}),
+    ("Auto Repeat", "reference_doctype", {"disabled": 0}),
+    ("Energy Point Rule", "reference_doctype", {"enabled": 1}),
+    ("Milestone Tracker", "document_type", {"disabled": 0}),
+    ("Workflow", "document_type", {"is_active": 1}),
+)
+
+
+def get_bulk_import_issues(doctype: str) -> list[str]:
+    """Returns the reasons why `doctype` can't be imported in bulk, if any"""
+    meta = frappe.get_meta(doctype)
+    issues = []
+
+    for prop, label in (
+        ("issingle", "is a Single DocType"),
+        ("istable", "is a Child Table"),
+        ("is_submittable", "is submittable"),
+        ("is_tree", "is a Tree"),
+        ("is_virtual", "is virtual"),
+    ):
+        if meta.get(prop):
+            issues.append(f"{doctype} {label}")
+
+    if meta.autoname == "autoincrement":
+        issues.append(f"{doctype} is named by autoincrement")
+
+    if meta.get_table_fields():
+        issues.append(f"{doctype} has child tables")
+
+    doc_events = frappe.get_hooks("doc_events")
+    if doctype in doc_events:
+        issues.append(f"{doctype} has doc_events hooks")
+
+    # Frappe's own hooks for all DocTypes only act through the configurations checked below
+    if any(
+        not handler.startswith("frappe.")
+        for event, handlers in doc_events.get("*", {}).items()
+        if event in CONTROLLER_METHODS
+        for handler in handlers
+    ):
+        issues.append("doc_events hooks are set for all DocTypes")
+
+    for config_doctype, doctype_field, filters in DOCTYPE_CONFIGURATIONS:
+        if frappe.get_all(config_doctype, filters={doctype_field: doctype, **filters}, limit=1):
+            issues.append(f"{doctype} has active {config_doctype} records")
+
+    if frappe.get_all(
+        "Server Script",
+        filters={"reference_doctype": doctype, "script_type": "DocType Event", "disabled": 0},
+        limit=1,
+    ):
+        issues.append(f"{doctype} has DocType Event Server Scripts")
+
+    controller = get_controller(doctype)
+    if overridden_methods := [
+        method
+        for method in CONTROLLER_METHODS
+        if getattr(controller, method, None) is not getattr(Document, method, None)
+    ]:
+        issues.append(f"{doctype}'s controller implements {', '.join(overridden_methods)}")
+
+    return issues
+
+
+class SheetsImporter(Importer):
+    """Importer for Data Imports created from worksheets. Each import gets its own instance, so
+    imports can run concurrently in the same process.
+
+    Updates differ from Frappe's Importer in that rows without an ID are matched by a unique field,
+    rows not matching an existing record are inserted & unchanged records aren't saved again."""
+
+    def update_record(self, doc):
+        id_field = get_id_field(self.doctype)
+        unique_field = None
+
+        # override_1: If no id field is set, try to find a unique field
+        if not doc.get(id_field.fieldname):
+            for field in self.unique_fields:
+                if doc.get(field.fieldname):
+                    unique_field = field
+                    break
+
+        # override_2: Use unique field if id field is not set, insert if existing doc is not found
+        existing_doc, updated_doc = self.get_initial_docs(doc, id_field, unique_field)
+        updated_doc.update(doc)
+
+        if get_diff(existing_doc, updated_doc):
+            # update doc if there are changes
+            updated_doc.flags.updater_reference = {
+                "doctype": self.data_import.doctype,
+                "docname": self.data_import.name,
+                "label": _("via Data Import"),
+            }
+            updated_doc.save()
+            if existing_doc.is_new():
+                fieldname = (unique_field or id_field).fieldname
+                self.add_existing_name(fieldname, doc.get(fieldname), updated_doc.name)
+            return updated_doc
+
+        # override_3: Return existing doc if no changes
+        return existing_doc
+
+    @cached_property
+    def unique_fields(self) -> list:
+        return [df for df in frappe.get_meta(self.doctype).fields if df.unique]
+
+    @cached_property
+    def existing_names(self) -> dict[str, dict[str, str | None]]:
+        return {}
+
+    def get_initial_docs(self, doc, id_field, unique_field):
+        fieldname = (unique_field or id_field).fieldname
+
+        try:
+            if name := self.get_existing_name(fieldname, doc.get(fieldname)):
+                existing_doc = frappe.get_doc(self.doctype, name)
+                # copy the loaded document instead of loading it again
+                updated_doc = frappe.get_doc(existing_doc.as_dict())
+                return existing_doc, updated_doc
+
+        except frappe.DoesNotExistError:
+            frappe.clear_last_message()
+
+        existing_doc = frappe.new_doc(self.doctype)
+        updated_doc = frappe.new_doc(self.doctype)
+
+        return existing_doc, updated_doc
+
+    def get_existing_name(self, fieldname: str, value) -> str | None:
+        """Returns the name of the existing record with `value` for `fieldname`. Names for all the
+        values of the field's column in the import file are fetched on first access, in chunks."""
+        if fieldname not in self.existing_names:
+            self.existing_names[fieldname] = get_existing_names(
+                self.doctype, fieldname, self.get_column_values(fieldname)
+            )
+
+        if value in INVALID_VALUES:
+            return None
+
+        existing_names = self.existing_names[fieldname]
+        if (key := get_lookup_key(value)) in existing_names:
+            return existing_names[key]
+
+        # value missing from the import file's column, eg: set by a default or a hook
+        return frappe.db.get_value(self.doctype, {fieldname: value})
+
+    def add_existing_name(self, fieldname: str, value, name: str):
+        """Records the record inserted for `value`, so rows repeating it later in the file update
+        it instead of inserting it again"""
+        if value not in INVALID_VALUES:
+            self.existing_names[fieldname][get_lookup_key(value)] = name
+
+    def get_column_values(self, fieldname: str) -> list:
+        for column in self.import_file.columns:
+            if column.df and column.doctype == self.doctype and column.df.fieldname == fieldname:
+                return column.column_values
+        return []
+
+
+class BulkImporter(Importer):
+    """Inserts the rows of an INSERT Data Import with multi-row INSERTs instead of a
+    `doc.insert()` per row. Rows are validated like `Document.insert` does, minus the controller
+    methods & hooks, which is why only DocTypes passing `get_bulk_import_issues` are allowed."""
+
+    def import_data(self):
+        if issues := get_bulk_import_issues(self.doctype):
+            frappe.throw(f"Bulk import isn't allowed: {'; '.join(issues)}")
+
+        frappe.flags.in_import = True
+        frappe.flags.mute_emails = self.data_import.mute_emails
+
+        # retried imports skip the rows imported already & log their failures again, like Frappe's
+        import_logs = frappe.get_all(
+            "Data Import Log",
+            filters={"data_import": self.data_import.name},
+            fields=["success", "row_indexes", "log_index"],
+            order_by="log_index",
+        )
+        imported_rows = {
+            row_index
+            for log in import_logs
+            if log.success
+            for row_index in json.loads(log.row_indexes)
+        }
+        frappe.db.delete("Data Import Log", {"data_import": self.data_import.name, "success": 0})
+
+        payloads = [
+            payload
+            for payload in self.import_file.get_payloads_for_import()
+            if not imported_rows.intersection(row.row_number for row in payload.rows)
+        ]
+        self.log_index = max((cint(log.log_index) for log in import_logs), default=-1) + 1
+        self.failures = 0
+
+        for idx in range(0, len(payloads), BULK_INSERT_CHUNK_SIZE):
+            self.import_chunk(payloads[idx : idx + BULK_INSERT_CHUNK_SIZE])
+
+        if payloads and self.failures == len(payloads) and not imported_rows:
+            status = "Pending"
+        elif self.failures:
+            status = "Partial Success"
+        else:
+            status = "Success"
+
+        frappe.flags.in_import = False
+        frappe.flags.mute_emails = False
+        self.data_import.db_set("status", status)
+
+    def import_chunk(self, payloads):
+        validated_docs = []
+
+        for payload in payloads:
+            row_indexes = [row.row_number for row in payload.rows]
+            try:
+                validated_docs.append((self.get_validated_doc(payload.doc), row_indexes))
+            except Exception:
+                self.log_failure(row_indexes)
+
+        if not validated_docs:
+            return
+
+        frappe.db.savepoint("bulk_import")
+        try:
+            self.bulk_insert([doc for doc, _ in validated_docs])
+        except Exception:
+            # isolate the rows failing at the database level, eg: duplicate names
+            frappe.db.rollback(save_point="bulk_import")
+            self.insert_one_by_one(validated_docs)
+        else:
+            for doc, row_indexes in validated_docs:
+                self.log_success(doc, row_indexes)
+
+    def get_validated_doc(self, doc_dict) -> Document:
+        doc = frappe.new_doc(self.doctype)
+        doc.update(doc_dict)
+
+        doc.flags.in_insert = True
+        doc._set_defaults()
+        doc.set_user_and_timestamp()
+        doc.set_docstatus()
+        doc._validate_links()
+        doc.set_new_name()
+        doc._validate()
+        doc.flags.in_insert = False
+
+        return doc
+
+    def bulk_insert(self, docs: list[Document]):
+        rows = [doc.get_valid_dict(convert_dates_to_str=True, ignore_nulls=False) for doc in docs]
+        fields = list(rows[0])
+        frappe.db.bulk_insert(
+            self.doctype, fields=fields, values=[[row[f] for f in fields] for row in rows]
+        )
+
+    def insert_one_by_one(self, validated_docs):
+        for doc, row_indexes in validated_docs:
+            frappe.db.savepoint("bulk_import_row")
+            try:
+                doc.db_insert()
+            except Exception:
+                frappe.db.rollback(save_point="bulk_import_row")
+                self.log_failure(row_indexes)
+            else:
+                self.log_success(doc, row_indexes)
+
+    def log_success(self, doc: Document, row_indexes: list[int]):
+        self.create_import_log(
+            {"success": 1, "docname": doc.name, "row_indexes": row_indexes, "messages": []}
+        )
+
+    def log_failure(self, row_indexes: list[int]):
+        messages = frappe.local.message_log
+        frappe.clear_messages()
+        self.failures += 1
+        self.create_import_log(
+            {
+                "success": 0,
+                "row_indexes": row_indexes,
+                "messages": messages,
+                "exception": frappe.get_traceback(),
+            }
+        )
+
+    def create_import_log(self, log_details: dict):
+        frappe.get_doc(
+            {
+                "doctype": "Data Import Log",
+                "log_index": self.log_index,
+                "success": log_details["success"],
+                "data_import": self.data_import.name,
+                "row_indexes": json.dumps(log_details["row_indexes"]),
+                "docname": log_details.get("docname"),
+                "messages": json.dumps(log_details["messages"]),
+                "exception": log_details.get("exception"),
+            }
+        ).db_insert()
+        self.log_index += 1
+
+
+def get_existing_names(doctype: str, fieldname: str, values: list) -> dict[str, str | None]:
+    """Returns the names of the records with `values` for `fieldname`, keyed by `get_lookup_key`
+    of the values"""
+    values = list({cstr(x) for x in values if x not in INVALID_VALUES})
+    existing_names = dict.fromkeys(get_lookup_key(x) for x in values)
+
+    for idx in range(0, len(values), EXISTING_RECORDS_CHUNK_SIZE):
+        records = frappe.get_all(
+            doctype,
+            filters={fieldname: ("in", values[idx : idx + EXISTING_RECORDS_CHUNK_SIZE])},
+            fields=["name", fieldname] if fieldname != "name" else ["name"],
+            order_by=None,
+        )
+        existing_names.update({get_lookup_key(x[fieldname]): x.name for x in records})
+
+    return existing_names
+
+
+def get_lookup_key(value) -> str:
+    """Returns the key of `value` among the values matched by the database. MariaDB's default
+    collations compare strings ignoring case, accents & trailing spaces, so the records found for
+    a value may not hold it as is."""
+    value = cstr(value)
+    if frappe.db.db_type != "mariadb":
+        return value
+
+    value = unicodedata.normalize("NFKD", value.rstrip(" "))
+    return "".join(x for x in value if not unicodedata.combining(x)).casefold()
+
+
+def get_importer_class(data_import) -> type[Importer]:
+    if data_import.import_type == INSERT and frappe.db.get_value(
+        "DocType Worksheet Mapping", data_import.worksheet_id, "bulk_import"
+    ):
+        return BulkImporter
+    return SheetsImporter
+
+
+def start_import(data_import: str):
+    data_import = frappe.get_doc("Data Import", data_import)
+
+    try:
+        importer_class = get_importer_class(data_import)
+        importer_class(data_import.reference_doctype, data_import=data_import).import_data()
+    except Exception:
+        frappe.db.rollback()
+        data_import.db_set("status", "Error")
+        data_import.log_error("Data Import failed")
+    finally:
+        frappe.flags.in_import = False
+
+    # the import's results are still written back & its parent updated if folding it in fails
+    frappe.db.savepoint("after_worksheet_import")
+    try:
+        after_worksheet_import(data_import)
+    except Exception:
+        frappe.db.rollback(save_point="after_worksheet_import")
+        data_import.log_error("Updating the worksheet after the import failed")
+
+    queue_status_write_back(data_import)
+    # releases the lock on the shard's own row before it waits on the parent's, see finish_shard
+    frappe.db.commit()
+    finish_shard(data_import)
+    frappe.publish_realtime("data_import_refresh", {"data_import": data_import.name})
+
+
+def after_worksheet_import(data_import):
+    """Folds a completed import into its worksheet's fingerprints & counter. Frappe's Importer sets
+    the status to Partial Success after the first imported row already, so this can't run off
+    the Data Import's status changes."""
+    from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
+        ACCEPTABLE_IMPORT_STATUSES,
+    )
+
+    if not data_import.get("worksheet_id") or data_import.status not in ACCEPTABLE_IMPORT_STATUSES:
+        return
+
+    worksheet = frappe.get_doc("DocType Worksheet Mapping", data_import.worksheet_id)
+    worksheet.update_row_fingerprints(data_import)
+    if data_import.get("worksheet_row_start"):
+        worksheet.advance_counter()
+
+
+def queue_status_write_back(data_import):
+    """Marks a finished import's results to be written to its worksheet by the next sync, see
+    `SpreadSheet.write_back_import_statuses`. Frappe's Importer updates the status while it runs,
+    so the results can't be picked up off the status alone."""
+    if data_import.get("worksheet_id") and frappe.db.get_value(
+        "DocType Worksheet Mapping", data_import.worksheet_id, "write_back_status"
+    ):
+        data_import.db_set("write_back_pending", 1, update_modified=False)
+
+
+def finish_shard(data_import):
+    """Marks a shard of an update as finished. The last shard to finish sets the status of their
+    parent import from theirs & sets the parent as the worksheet's `last_update_import` if every
+    shard succeeded. Shards retried later update the parent again. Runs in a transaction of its
+    own, the shard's results are committed before."""
+    from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
+        ACCEPTABLE_IMPORT_STATUSES,
+    )
+
+    if not data_import.get("parent_import"):
+        return
+
+    # shards finish concurrently, the parent's row is locked before any other write so they
+    # queue on it instead of deadlocking on each other's rows, & the shards are read past this
+    # transaction's snapshot, so that the last shard to finish sees all the others finished
+    frappe.db.get_value("Data Import", data_import.parent_import, "name", for_update=True)
+    data_import.db_set("shard_finished", 1, update_modified=False)
+    shards = frappe.get_all(
+        "Data Import",
+        filters={"parent_import": data_import.parent_import},
+        fields=["status", "shard_finished"],
+        for_update=True,
+    )
+    if not all(x.shard_finished for x in shards):
+        return
+
+    succeeded = [x for x in shards if x.status in ACCEPTABLE_IMPORT_STATUSES]
+    if len(succeeded) < len(shards):
+        status = "Partial Success" if succeeded else "Error"
+    else:
+        status = "Success" if all(x.status == "Success" for x in shards) else "Partial Success"
+    frappe.db.set_value("Data Import", data_import.parent_import, "status", status)
+
+    if len(succeeded) == len(shards):
+        frappe.db.set_value(
+            "DocType Worksheet Mapping",
+            data_import.worksheet_id,
+            "last_update_import",
+            data_import.parent_import,
+            update_modified=False,
+        )
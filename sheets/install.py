@@ -24,7 +24,92 @@ def create_data_import_fields():
             "hidden": 1,
         },
     )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "row_fingerprints_updated",
+            "label": "Row Fingerprints Updated",
+            "fieldtype": "Check",
+            "insert_after": "worksheet_id",
+            "hidden": 1,
+            "read_only": 1,
+        },
+    )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "worksheet_row_start",
+            "label": "Worksheet Row Start",
+            "fieldtype": "Int",
+            "insert_after": "row_fingerprints_updated",
+            "description": "Worksheet row of the first row imported in this chunk",
+            "read_only": 1,
+            "depends_on": "worksheet_row_start",
+        },
+    )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "worksheet_row_count",
+            "label": "Worksheet Row Count",
+            "fieldtype": "Int",
+            "insert_after": "worksheet_row_start",
+            "read_only": 1,
+            "depends_on": "worksheet_row_start",
+        },
+    )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "worksheet_row_numbers",
+            "label": "Worksheet Row Numbers",
+            "fieldtype": "Long Text",
+            "insert_after": "worksheet_row_count",
+            "description": "Worksheet rows of the rows of an update import file, as a JSON list",
+            "hidden": 1,
+            "read_only": 1,
+        },
+    )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "write_back_pending",
+            "label": "Write Back Pending",
+            "fieldtype": "Check",
+            "insert_after": "worksheet_row_numbers",
+            "hidden": 1,
+            "read_only": 1,
+        },
+    )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "parent_import",
+            "label": "Parent Import",
+            "fieldtype": "Link",
+            "options": "Data Import",
+            "insert_after": "write_back_pending",
+            "description": "Import tracking the shards of an update, imported in parallel",
+            "read_only": 1,
+            "depends_on": "parent_import",
+        },
+    )
+    create_custom_field(
+        "Data Import",
+        {
+            "fieldname": "shard_finished",
+            "label": "Shard Finished",
+            "fieldtype": "Check",
+            "insert_after": "parent_import",
+            "hidden": 1,
+            "read_only": 1,
+        },
+    )
 
 
 def after_install():
     create_data_import_fields()
+
+
+def after_migrate():
+    create_data_import_fields()
@@ -0,0 +1,266 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+"""Columnar normalization of worksheet values before they're imported. The rows are processed in
+batches, column by column: each column is coerced as a whole by the normalizer of the field it
+maps to, with any format, eg: of dates, worked out once for the column. Rows with values that
+can't be coerced are rejected before any document is built for them."""
+
+import math
+import re
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import frappe
+from frappe.core.doctype.data_import.importer import get_df_for_column_header
+from frappe.utils import get_number_format_info
+
+from sheets.profiling import stage
+
+# rows normalized per batch, column by column
+NORMALIZE_BATCH_SIZE = 1_000
+
+# rejected rows listed in the import messages, the rest are only counted
+REJECTED_ROWS_SHOWN = 10
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%m-%d-%Y",
+    "%d.%m.%Y",
+    "%Y/%m/%d",
+    "%d %b %Y",
+    "%d %B %Y",
+    "%b %d, %Y",
+    "%B %d, %Y",
+)
+TIME_FORMATS = ("%H:%M:%S", "%H:%M", "%I:%M:%S %p", "%I:%M %p", "%H:%M:%S.%f")
+TRUE_VALUES = {"1", "true", "yes", "y", "on", "✓", "✔"}
+FALSE_VALUES = {"0", "false", "no", "n", "off"}
+# currency symbols or codes before or after a number, & percent signs
+NUMBER_AFFIXES = re.compile(r"^(?:[A-Z]{3}\s+|[^\w\s.,()]+)|(?:\s+[A-Z]{3}|[^\w\s.,()]+)$")
+
+# a normalizer takes a column's values & returns them coerced, along with the errors by index
+Normalizer = Callable[[list[str]], tuple[list[str], dict[int, str]]]
+
+
+class RejectedRow(NamedTuple):
+    row_number: int
+    errors: list[str]
+
+
+class RowNormalizer:
+    """Normalizes the rows of a worksheet for the columns of `header_row` mapped to fields of
+    `doctype`. Cells are trimmed, numbers, checks, dates & times are coerced to the formats Frappe
+    parses as is & values of Select fields are validated against their options."""
+
+    def __init__(self, doctype: str, header_row: list[str]):
+        self.header_row = header_row
+        self.normalizers = [get_column_normalizer(doctype, column) for column in header_row]
+        self.rejected_rows: list[RejectedRow] = []
+
+    def normalize(
+        self, numbered_rows: Iterable[tuple[int, list[str]]]
+    ) -> Iterator[tuple[int, list[str]]]:
+        """Yields the (worksheet row number, row) pairs of `numbered_rows` with the rows
+        normalized. Rejected rows are yielded empty, so they're skipped by the diff & the Importer
+        while the rows keep their positions, & recorded in `rejected_rows`."""
+        numbered_rows, width = iter(numbered_rows), len(self.header_row)
+
+        while batch := list(islice(numbered_rows, NORMALIZE_BATCH_SIZE)):
+            row_numbers = [row_number for row_number, _ in batch]
+            with stage("normalize"):
+                rows = self.normalize_batch([row for _, row in batch], row_numbers, width)
+            yield from zip(row_numbers, rows)
+
+    def normalize_batch(
+        self, batch: list[list[str]], row_numbers: list[int], width: int
+    ) -> list[list[str]]:
+        padded_rows = (row[:width] + [""] * (width - len(row)) for row in batch)
+        columns = [list(column) for column in zip(*padded_rows)]
+        row_errors: dict[int, list[str]] = {}
+
+        for idx, (column_name, normalizer) in enumerate(zip(self.header_row, self.normalizers)):
+            columns[idx], errors = normalizer(columns[idx])
+            for row_idx, error in errors.items():
+                row_errors.setdefault(row_idx, []).append(f"{column_name}: {error}")
+
+        normalized_rows = [list(row) for row in zip(*columns)] or [[] for _ in batch]
+        for row_idx, errors in sorted(row_errors.items()):
+            normalized_rows[row_idx] = [""] * width
+            self.rejected_rows.append(RejectedRow(row_numbers[row_idx], errors))
+
+        return normalized_rows
+
+    def get_messages(self) -> list[str]:
+        if not self.rejected_rows:
+            return []
+
+        details = "<br>".join(
+            f"Row {x.row_number}: {'; '.join(x.errors)}"
+            for x in self.rejected_rows[:REJECTED_ROWS_SHOWN]
+        )
+        if (more := len(self.rejected_rows) - REJECTED_ROWS_SHOWN) > 0:
+            details += f"<br>and {more} more"
+        return [f"Skipped {len(self.rejected_rows)} rows with invalid values:<br>{details}"]
+
+
+def get_column_normalizer(doctype: str, column: str) -> Normalizer:
+    df = get_df_for_column_header(doctype, column) if column else None
+
+    match df and df.fieldtype:
+        case "Int":
+            return NumberNormalizer(whole_numbers=True)
+        case "Float" | "Currency" | "Percent":
+            return NumberNormalizer()
+        case "Check":
+            return normalize_check
+        case "Date":
+            return DateNormalizer(DATE_FORMATS, "%Y-%m-%d")
+        case "Datetime":
+            return DateNormalizer(get_datetime_formats(), "%Y-%m-%d %H:%M:%S")
+        case "Time":
+            return DateNormalizer(TIME_FORMATS, "%H:%M:%S")
+        case "Select":
+            return SelectNormalizer(df.options)
+        case _:
+            return normalize_text
+
+
+def normalize_text(values: list[str]) -> tuple[list[str], dict[int, str]]:
+    return [value.strip() for value in values], {}
+
+
+def normalize_check(values: list[str]) -> tuple[list[str], dict[int, str]]:
+    return coerce_values(values, parse_check)
+
+
+def coerce_values(
+    values: list[str], coerce: Callable[[str], str]
+) -> tuple[list[str], dict[int, str]]:
+    """Applies `coerce` to the non empty values, collecting the ValueErrors it raises"""
+    coerced, errors = [], {}
+
+    for idx, value in enumerate(values):
+        if not (value := value.strip()):
+            coerced.append(value)
+            continue
+        try:
+            coerced.append(coerce(value))
+        except ValueError as e:
+            coerced.append(value)
+            errors[idx] = str(e)
+
+    return coerced, errors
+
+
+class NumberNormalizer:
+    """Coerces formatted numbers, eg: "$ 1,234.50", "(12)" or "15%", to plain ones, with the
+    separators of the system number format"""
+
+    def __init__(self, whole_numbers: bool = False):
+        self.whole_numbers = whole_numbers
+        self.decimal_str, self.comma_str, _ = get_number_format_info(
+            frappe.db.get_default("number_format") or "#,###.##"
+        )
+
+    def __call__(self, values: list[str]) -> tuple[list[str], dict[int, str]]:
+        return coerce_values(values, self.coerce)
+
+    def coerce(self, value: str) -> str:
+        number = self.parse(value)
+        if not self.whole_numbers:
+            return repr(number)
+        if not number.is_integer():
+            raise ValueError(f"{value!r} isn't a whole number")
+        return str(int(number))
+
+    def parse(self, value: str) -> float:
+        negative = value.startswith("-") or (value.startswith("(") and value.endswith(")"))
+        number = NUMBER_AFFIXES.sub("", value.lstrip("+-").strip("()")).strip()
+        number = number.replace(self.comma_str, "").replace(" ", "")
+        if self.decimal_str and self.decimal_str != ".":
+            number = number.replace(self.decimal_str, ".")
+
+        try:
+            result = float(number)
+        except ValueError:
+            result = math.nan
+        if not math.isfinite(result):
+            raise ValueError(f"{value!r} isn't a number")
+        return -result if negative else result
+
+
+def parse_check(value: str) -> str:
+    if value.lower() in TRUE_VALUES:
+        return "1"
+    if value.lower() in FALSE_VALUES:
+        return "0"
+    raise ValueError(f"{value!r} isn't a checkbox value")
+
+
+def get_datetime_formats() -> tuple[str, ...]:
+    datetime_formats = tuple(f"{x} {y}" for x in DATE_FORMATS for y in TIME_FORMATS)
+    return datetime_formats + DATE_FORMATS
+
+
+class DateNormalizer:
+    """Coerces a column's values to `output_format`. The format of the column is the first of
+    `formats` parsing its first value, preferring the system date format for ambiguous dates.
+    Values not in the column's format, eg: typed in by hand, are parsed by the first of the other
+    formats matching them."""
+
+    def __init__(self, formats: tuple[str, ...], output_format: str):
+        self.formats = prefer_system_date_format(formats)
+        self.output_format = output_format
+        self.column_format: str | None = None
+
+    def __call__(self, values: list[str]) -> tuple[list[str], dict[int, str]]:
+        return coerce_values(values, self.coerce)
+
+    def coerce(self, value: str) -> str:
+        if self.column_format and (parsed := parse_datetime(value, self.column_format)):
+            return parsed.strftime(self.output_format)
+
+        for date_format in self.formats:
+            if parsed := parse_datetime(value, date_format):
+                self.column_format = self.column_format or date_format
+                return parsed.strftime(self.output_format)
+        raise ValueError(f"{value!r} isn't a valid date or time")
+
+
+class SelectNormalizer:
+    def __init__(self, options: str | None):
+        self.options = {x.strip() for x in (options or "").split("\n")}
+
+    def __call__(self, values: list[str]) -> tuple[list[str], dict[int, str]]:
+        return coerce_values(values, self.coerce)
+
+    def coerce(self, value: str) -> str:
+        if value not in self.options:
+            raise ValueError(f"{value!r} isn't one of the options")
+        return value
+
+
+def parse_datetime(value: str, date_format: str) -> datetime | None:
+    try:
+        return datetime.strptime(value, date_format)
+    except ValueError:
+        return None
+
+
+def prefer_system_date_format(formats: tuple[str, ...]) -> tuple[str, ...]:
+    """Moves the formats with the day & month in the order of the system date format, eg:
+    dd-mm-yyyy, to the front, so that it decides ambiguous dates like 01/02/2023"""
+    system_date_format = frappe.db.get_default("date_format") or "dd-mm-yyyy"
+    day_first = system_date_format.index("dd") < system_date_format.index("mm")
+
+    def is_preferred(date_format: str) -> bool:
+        if "%d" not in date_format or "%m" not in date_format:
+            return False
+        return (date_format.index("%d") < date_format.index("%m")) == day_first
+
+    return tuple(sorted(formats, key=lambda x: not is_preferred(x)))
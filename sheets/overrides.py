@@ -1,4 +1,6 @@
 import frappe
+from frappe import _
+from frappe.core.doctype.data_import.data_import import DataImport
 
 import sheets
 
@@ -10,55 +12,38 @@ def has_permission(doc, ptype, user):
         raise frappe.PermissionError("Not allowed to access")
 
 
-def get_initial_docs(self, doc, id_field, unique_field):
-    try:
-        if unique_field:
-            existing_doc = frappe.get_doc(
-                self.doctype, {unique_field.fieldname: doc.get(unique_field.fieldname)}
-            )
-            updated_doc = frappe.get_doc(
-                self.doctype, {unique_field.fieldname: doc.get(unique_field.fieldname)}
-            )
-        else:
-            existing_doc = frappe.get_doc(self.doctype, doc.get(id_field.fieldname))
-            updated_doc = frappe.get_doc(self.doctype, doc.get(id_field.fieldname))
-
-    except frappe.DoesNotExistError:
-        frappe.clear_last_message()
-        existing_doc = frappe.new_doc(self.doctype)
-        updated_doc = frappe.new_doc(self.doctype)
-
-    return existing_doc, updated_doc
+class SheetsDataImport(DataImport):
+    @frappe.whitelist()
+    def start_import(self):
+        # worksheet imports (retries from the UI included) run through sheets' importers
+        if not self.get("worksheet_id"):
+            return super().start_import()
 
+        if frappe.db.exists("Data Import", {"parent_import": self.name}):
+            frappe.throw(_("This import runs through its shards, retry the failed ones instead."))
 
-def update_record_patch(self, doc):
-    from frappe import _
-    from frappe.core.doctype.data_import.importer import get_diff, get_id_field
+        from frappe.utils.background_jobs import is_job_enqueued
+        from frappe.utils.scheduler import is_scheduler_inactive
 
-    id_field = get_id_field(self.doctype)
-    unique_field = None
-
-    # override_1: If no id field is set, try to find a unique field
-    if not doc.get(id_field.fieldname):
-        unique_fields = [df for df in frappe.get_meta(self.doctype).fields if df.unique]
-        for field in unique_fields:
-            if doc.get(field.fieldname):
-                unique_field = field
-                break
-
-    # override_2: Use unique field if id field is not set, insert if existing doc is not found
-    existing_doc, updated_doc = get_initial_docs(self, doc, id_field, unique_field)
-    updated_doc.update(doc)
+        run_now = frappe.flags.in_test or frappe.conf.developer_mode
+        if is_scheduler_inactive() and not run_now:
+            frappe.throw(
+                _("Scheduler is inactive. Cannot import data."), title=_("Scheduler Inactive")
+            )
 
-    if get_diff(existing_doc, updated_doc):
-        # update doc if there are changes
-        updated_doc.flags.updater_reference = {
-            "doctype": self.data_import.doctype,
-            "docname": self.data_import.name,
-            "label": _("via Data Import"),
-        }
-        updated_doc.save()
-        return updated_doc
+        # same job id as Frappe's, so an import is never run by two jobs at once
+        job_id = f"data_import::{self.name}"
+
+        if not is_job_enqueued(job_id):
+            frappe.enqueue(
+                "sheets.importer.start_import",
+                queue="default",
+                timeout=10000,
+                event="data_import",
+                job_id=job_id,
+                data_import=self.name,
+                now=run_now,
+            )
+            return True
 
-    # override_3: Return existing doc if no changes
-    return existing_doc
+        return False
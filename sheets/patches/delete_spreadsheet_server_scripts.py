@@ -0,0 +1,13 @@
+import frappe
+
+
+def execute():
+    """Scheduled imports are enqueued by sheets.scheduler.dispatch_syncs, replacing the Server
+    Script each SpreadSheet had for its import frequency"""
+    if not frappe.db.has_column("SpreadSheet", "server_script"):
+        return
+
+    for server_script in frappe.get_all(
+        "SpreadSheet", filters={"server_script": ("is", "set")}, pluck="server_script"
+    ):
+        frappe.delete_doc("Server Script", server_script, force=True, ignore_missing=True)
@@ -0,0 +1,134 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+import cProfile
+import pstats
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from io import StringIO
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from requests import Response
+
+STAGES = (
+    "metadata",
+    "prefetch",
+    "fetch",
+    "reconstruct",
+    "normalize",
+    "diff",
+    "write",
+    "import",
+    "write_back",
+)
+
+# lines of the cProfile report kept, sorted by cumulative time
+PROFILE_REPORT_LINES = 60
+
+_sync_stats: ContextVar["SyncStats | None"] = ContextVar("sheets_sync_stats", default=None)
+
+
+class SyncStats:
+    """Stage timings & counters of a sync run, or of a worksheet's import within it. Timings are
+    exclusive, time spent in a stage nested in another is only counted towards the inner one."""
+
+    def __init__(self):
+        self.stage_times = dict.fromkeys(STAGES, 0.0)
+        self.api_calls = 0
+        self.bytes_fetched = 0
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.profile_report: str | None = None
+        self._stages: list[list] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        frame = [name, 0.0]  # stage name, time spent in nested stages
+        self._stages.append(frame)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self._stages.pop()
+            self.stage_times[name] += elapsed - frame[1]
+            if self._stages:
+                self._stages[-1][1] += elapsed
+
+    def merge(self, other: "SyncStats"):
+        for name, elapsed in other.stage_times.items():
+            self.stage_times[name] += elapsed
+        self.api_calls += other.api_calls
+        self.bytes_fetched += other.bytes_fetched
+        self.rows_fetched += other.rows_fetched
+        self.rows_written += other.rows_written
+
+    def as_dict(self) -> dict:
+        return {
+            "stage_times": {name: round(x, 6) for name, x in self.stage_times.items()},
+            "api_calls": self.api_calls,
+            "bytes_fetched": self.bytes_fetched,
+            "rows_fetched": self.rows_fetched,
+            "rows_written": self.rows_written,
+        }
+
+
+def get_sync_stats() -> SyncStats | None:
+    return _sync_stats.get()
+
+
+@contextmanager
+def use_sync_stats(stats: SyncStats):
+    """Records the stages & counters of the block in `stats`. Context variables aren't inherited
+    by threads, so worker threads have to enter this themselves."""
+    token = _sync_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _sync_stats.reset(token)
+
+
+def stage(name: str):
+    if stats := _sync_stats.get():
+        return stats.stage(name)
+    return nullcontext()
+
+
+def record_rows(fetched: int = 0, written: int = 0):
+    if stats := _sync_stats.get():
+        stats.rows_fetched += fetched
+        stats.rows_written += written
+
+
+def instrument_request(request: Callable[..., "Response"]) -> Callable[..., "Response"]:
+    """Wraps a gspread client's `request` method to count the API calls & bytes received"""
+
+    @wraps(request)
+    def instrumented_request(*args, **kwargs):
+        response = request(*args, **kwargs)
+        if stats := _sync_stats.get():
+            stats.api_calls += 1
+            stats.bytes_fetched += len(response.content)
+        return response
+
+    return instrumented_request
+
+
+@contextmanager
+def capture_profile(stats: SyncStats):
+    """Profiles the block with cProfile, setting the report on `stats`. Only the current thread
+    is profiled."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        buffer = StringIO()
+        pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(
+            PROFILE_REPORT_LINES
+        )
+        stats.profile_report = buffer.getvalue()
@@ -0,0 +1,89 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+"""Scheduled imports of SpreadSheets. A single dispatcher runs on every scheduler tick & enqueues
+the syncs of the sheets due, instead of every sheet having its own scheduler event."""
+
+import random
+from datetime import datetime, timedelta
+
+import frappe
+from croniter import croniter
+from frappe.utils import cint, now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
+
+from sheets.constants import MAX_CONCURRENT_SYNCS, MAX_POLL_BACKOFF, MAX_POLL_DELAY, SYNC_JITTER
+from sheets.sync_state import is_sync_running, set_queued
+
+
+def dispatch_syncs():
+    """Enqueues the syncs of the SpreadSheets due, most overdue first, keeping at most
+    `sheets_max_concurrent_syncs` (site config) running at once, manual syncs included. Sheets
+    left over are dispatched on the following ticks."""
+    max_syncs = cint(frappe.conf.sheets_max_concurrent_syncs) or MAX_CONCURRENT_SYNCS
+    scheduled_sheets = frappe.get_all(
+        "SpreadSheet",
+        filters={"import_frequency": ("is", "set")},
+        fields=["name", "next_sync_at"],
+        order_by="next_sync_at asc",
+    )
+    running_syncs = {
+        x.name
+        for x in scheduled_sheets
+        if is_job_enqueued(get_sync_job_id(x.name)) or is_sync_running(x.name)
+    }
+    now = now_datetime()
+
+    for sheet in scheduled_sheets:
+        if len(running_syncs) >= max_syncs:
+            break
+        # sheets never scheduled are due right away
+        if sheet.name in running_syncs or (sheet.next_sync_at and sheet.next_sync_at > now):
+            continue
+
+        frappe.enqueue(
+            sync_spreadsheet,
+            queue="long",
+            job_id=get_sync_job_id(sheet.name),
+            spreadsheet=sheet.name,
+        )
+        set_queued(sheet.name)
+        running_syncs.add(sheet.name)
+
+
+def sync_spreadsheet(spreadsheet: str):
+    doc = frappe.get_doc("SpreadSheet", spreadsheet)
+
+    try:
+        doc.trigger_import()
+    except Exception:
+        frappe.db.rollback()
+        doc.log_error("Scheduled import failed")
+        changed = None
+    else:
+        # polls merged into a sync already running keep the current backoff
+        changed = None if doc.flags.sync_skipped else not doc.flags.sheet_unchanged
+
+    doc.schedule_next_sync(changed=changed)
+
+
+def get_sync_job_id(spreadsheet: str) -> str:
+    return f"sheets::sync::{spreadsheet}"
+
+
+def get_next_sync_time(cron: str, after: datetime, backoff: int = 0) -> datetime:
+    """Returns the time of the next poll for `cron` after `after`. With a `backoff`, the gap
+    between polls is doubled that many times by skipping occurrences of `cron`, up to
+    MAX_POLL_BACKOFF times & to less than MAX_POLL_DELAY seconds past the next occurrence. A
+    random jitter of up to SYNC_JITTER seconds, or half the interval if shorter, is added."""
+    schedule = croniter(cron, after)
+    scheduled_time = next_time = schedule.get_next(datetime)
+
+    for _ in range(2 ** min(backoff, MAX_POLL_BACKOFF) - 1):
+        skipped_time = schedule.get_next(datetime)
+        if (skipped_time - scheduled_time).total_seconds() >= MAX_POLL_DELAY:
+            break
+        next_time = skipped_time
+
+    interval = (croniter(cron, next_time).get_next(datetime) - next_time).total_seconds()
+    return next_time + timedelta(seconds=random.uniform(0, min(interval / 2, SYNC_JITTER)))
@@ -1,127 +1,524 @@
 # Copyright (c) 2023, Gavin D'souza and contributors
 # For license information, please see license.txt
 
+import json
+import os
 from csv import reader as csv_reader
-from csv import writer as csv_writer
-from difflib import SequenceMatcher
 from functools import cached_property
 from io import StringIO
-from typing import TYPE_CHECKING
+from itertools import chain, count, repeat
+from operator import itemgetter
+from typing import TYPE_CHECKING, Iterable, Iterator, NamedTuple
 
 import frappe
-from frappe.core.doctype.data_import.importer import get_autoname_field
+from frappe.core.doctype.data_import.importer import get_autoname_field, get_df_for_column_header
 from frappe.model.document import Document
-from frappe.utils import get_link_to_form
-
-from sheets.constants import INSERT, UPDATE, UPSERT
+from frappe.utils import cint, cstr, get_link_to_form, strip_html
+from gspread.utils import absolute_range_name
+
+from sheets.constants import (
+    FETCH_BATCH_SIZE,
+    IMPORT_CHUNK_SIZE,
+    INSERT,
+    STATUS_MESSAGE_LENGTH,
+    UPDATE,
+    UPDATE_SHARD_MIN_ROWS,
+    UPDATE_SHARDS,
+    UPSERT,
+)
+from sheets.diff import diff_rows, fingerprint_rows, get_row_shard, is_empty_row, replay_imports
+from sheets.importer import get_bulk_import_issues
+from sheets.normalize import RowNormalizer
+from sheets.profiling import record_rows, stage
+from sheets.sheets_workspace.doctype.worksheet_row_fingerprint.worksheet_row_fingerprint import (
+    get_row_fingerprints,
+    has_row_fingerprints,
+    set_row_fingerprints,
+)
+from sheets.utils import (
+    CSVFile,
+    get_column_letter,
+    get_column_runs,
+    merge_column_ranges,
+    project_row,
+    read_csv_file,
+    write_csv_chunks,
+    write_csv_file,
+)
 
 if TYPE_CHECKING:
+    import gspread as gs
     from frappe.core.doctype.data_import.data_import import DataImport
+    from frappe.core.doctype.file.file import File
 
 ACCEPTABLE_IMPORT_STATUSES = ("Success", "Partial Success")
 
 
+class WorksheetImport(NamedTuple):
+    import_type: str
+    import_files: list[CSVFile]
+    messages: list[str]
+    # worksheet rows of the rows of each UPDATE import file, tracked for `write_back_status`
+    row_numbers: list[list[int] | None] | None = None
+    # fingerprints rebuilt from the import history & the import they're up to, stored when the
+    # import is applied as imports may be prepared in a thread whose changes aren't committed
+    rebuilt_fingerprints: tuple[dict[str, str], str | None] | None = None
+
+
 class DocTypeWorksheetMapping(Document):
-    def trigger_worksheet_import(self):
+    def import_notified_rows(self, row_numbers: Iterable[int]) -> list[str]:
+        """Imports the changes of the given rows only, as notified through the webhook. Rows
+        already imported are fetched & diffed on their own for Upsert, while rows past `counter`
+        are imported like by a sync, which only fetches the rows after it anyway. Returns the
+        messages of the imports."""
+        is_upsert = self.get_import_type() == UPSERT
+        self.advance_counter()
+        worksheet_imports = []
+
+        # without fingerprints to diff against, the rows can't be imported on their own
+        if self.reset_worksheet_on_import or (is_upsert and not has_row_fingerprints(self.name)):
+            worksheet_imports.append(self.prepare_worksheet_import())
+        else:
+            row_numbers = sorted(set(row_numbers))
+            if is_upsert and (updated_rows := [x for x in row_numbers if 1 < x <= self.counter]):
+                worksheet_imports.append(self.prepare_rows_update_import(updated_rows))
+            if any(x > self.counter for x in row_numbers):
+                worksheet_imports.append(self.prepare_insert_worksheet_import())
+
+        for worksheet_import in worksheet_imports:
+            self.apply_worksheet_import(worksheet_import)
+        return [message for x in worksheet_imports for message in x.messages]
+
+    def prepare_rows_update_import(self, row_numbers: list[int]) -> WorksheetImport:
+        """Prepares an update of the given, already imported rows, with the ones that changed"""
+        with stage("reconstruct"):
+            imported_fingerprints = get_row_fingerprints(self.name)
+
+        header_row = self.import_header_row
+        id_field_index = header_row.index(self.get_worksheet_id_field(header_row))
+        messages = []
+        remote_rows = self.normalize_rows(
+            header_row, zip(row_numbers, self.fetch_remote_rows(row_numbers)), messages
+        )
+
+        with stage("diff"):
+            row_diff = diff_rows(
+                imported_fingerprints, remote_rows, id_field_index, get_row=itemgetter(1)
+            )
+
+        if available_data_updates := [*row_diff.changed, *row_diff.inserted]:
+            import_files, shard_row_numbers = self.write_update_import_files(
+                header_row, available_data_updates, id_field_index
+            )
+            return WorksheetImport(UPDATE, import_files, messages, shard_row_numbers)
+        return WorksheetImport(UPDATE, [], messages)
+
+    def prepare_worksheet_import(self) -> WorksheetImport:
+        """Fetches & diffs the remote worksheet into an import file. Nothing is written to the
+        database at this stage, which allows worksheets to be prepared concurrently."""
         import_type = self.get_import_type()
         if import_type == UPSERT:
-            return self.trigger_upsert_worksheet_import()
+            return self.prepare_upsert_worksheet_import()
         elif import_type == INSERT:
-            return self.trigger_insert_worksheet_import()
+            return self.prepare_insert_worksheet_import()
         else:
             raise ValueError(f"Invalid import type: {self.import_type}")
 
-    def fetch_past_successful_imports(self, import_type: str):
+    def apply_worksheet_import(self, worksheet_import: WorksheetImport):
+        """Creates & starts the Data Import for a prepared import, updating the mapping's state"""
+        if worksheet_import.rebuilt_fingerprints and not has_row_fingerprints(self.name):
+            set_row_fingerprints(self.name, *worksheet_import.rebuilt_fingerprints)
+
+        for message in worksheet_import.messages:
+            frappe.msgprint(message, alert=True, indicator="orange")
+
+        import_files = worksheet_import.import_files
+
+        if worksheet_import.import_type == UPDATE:
+            # the shards of an update run in parallel, their parent import is only set as
+            # `last_update_import` once they all succeed, see `sheets.importer.finish_shard`
+            parent_import = self.create_parent_import() if len(import_files) > 1 else None
+            for import_file, row_numbers in zip(
+                import_files, worksheet_import.row_numbers or repeat(None)
+            ):
+                di = self.create_data_import(
+                    import_file,
+                    import_type=UPDATE,
+                    row_numbers=row_numbers,
+                    parent_import=parent_import,
+                )
+                frappe.enqueue_doc(
+                    di.doctype, di.name, method="start_import", enqueue_after_commit=True
+                )
+            # only the fields set here are written, the row's other fields may have been changed
+            # meanwhile, eg: `last_update_import` by the shards of an earlier update
+            values = {"id_field": self.id_field} if self.id_field else {}
+            if import_files and not parent_import:
+                self.last_update_import = values["last_update_import"] = di.name
+            if values:
+                self.db_set(values)
+            return
+
+        if not import_files:
+            frappe.msgprint("No data found to import.", alert=True, indicator="orange")
+            return
+
+        # chunks are queued right away & may complete in any order, `counter` is advanced as they
+        # succeed by `advance_counter`
+        row_start = self.get_next_row()
+        for import_file in import_files:
+            di = self.create_data_import(import_file, row_start=row_start)
+            frappe.enqueue_doc(
+                di.doctype, di.name, method="start_import", enqueue_after_commit=True
+            )
+            row_start += import_file.row_count - 1  # subtract header row
+
+        self.last_import = di.name
+        self.db_set("last_import", self.last_import)
+
+    def get_next_row(self) -> int:
+        """Returns the worksheet row the next Insert starts importing from"""
+        return max(cint(self.counter), 1) + 1
+
+    def advance_counter(self):
+        """Moves `counter` past the chunks imported successfully right after it. Chunks may succeed
+        in any order, the counter only ever covers an unbroken run of successful ones."""
+        # the chunks' jobs advance the counter concurrently, the row is locked for this transaction
+        self.counter = cint(
+            frappe.db.get_value(self.doctype, self.name, "counter", for_update=True)
+        )
+        next_row = self.get_next_row()
+
+        imported_chunks = dict(
+            frappe.get_all(
+                "Data Import",
+                filters={
+                    "worksheet_id": self.name,
+                    "import_type": INSERT,
+                    "status": ("in", ACCEPTABLE_IMPORT_STATUSES),
+                    "worksheet_row_start": (">=", next_row),
+                },
+                fields=["worksheet_row_start", "worksheet_row_count"],
+                as_list=True,
+                order_by=None,
+            )
+        )
+        while next_row in imported_chunks:
+            next_row += imported_chunks[next_row]
+
+        if next_row != self.get_next_row():
+            self.counter = next_row - 1
+            self.db_set("counter", self.counter, update_modified=False)
+
+    def get_outstanding_imports(self) -> list[dict]:
+        """Returns the Insert Data Imports of chunks past `counter`, ie: queued or failed ones"""
         return frappe.get_all(
             "Data Import",
             filters={
-                "spreadsheet_id": self.parent_doc.name,
                 "worksheet_id": self.name,
-                "import_type": import_type,
-                "status": ("in", ["Success", "Partial Success"]),
+                "import_type": INSERT,
+                "worksheet_row_start": (">=", self.get_next_row()),
             },
-            fields=["name", "import_file"],
-            order_by="creation",
+            fields=["name", "status"],
+            order_by="worksheet_row_start",
         )
 
-    def trigger_upsert_worksheet_import(self):
-        successful_insert_imports = self.fetch_past_successful_imports(import_type=INSERT)
+    def fetch_past_successful_imports(self, import_type: str, before=None):
+        """Returns the successful imports not yet folded into the baseline file, ie: with their
+        import file, optionally only those created before `before`"""
+        filters = {
+            "spreadsheet_id": self.parent_doc.name,
+            "worksheet_id": self.name,
+            "import_type": import_type,
+            "status": ("in", ["Success", "Partial Success"]),
+            "import_file": ("is", "set"),
+        }
+        if before:
+            filters["creation"] = ("<", before)
 
-        if not successful_insert_imports:
-            frappe.msgprint(
-                "No successful inserts found to continue UPSERT. Falling back to INSERT instead.",
-                alert=True,
-                indicator="orange",
+        return frappe.get_all(
+            "Data Import",
+            filters=filters,
+            fields=["name", "import_file", "creation"],
+            order_by="creation",
+        )
+
+    def prepare_upsert_worksheet_import(self) -> WorksheetImport:
+        rebuilt_fingerprints = None
+        with stage("reconstruct"):
+            if not (imported_fingerprints := get_row_fingerprints(self.name)):
+                rebuilt_fingerprints = self.rebuild_imported_fingerprints()
+                imported_fingerprints = rebuilt_fingerprints and rebuilt_fingerprints[0]
+
+        worksheet_import = self.diff_upsert_worksheet_import(imported_fingerprints)
+        return worksheet_import._replace(rebuilt_fingerprints=rebuilt_fingerprints)
+
+    def diff_upsert_worksheet_import(
+        self, imported_fingerprints: dict[str, str] | None
+    ) -> WorksheetImport:
+        if imported_fingerprints is None:
+            return self.prepare_insert_worksheet_import(
+                messages=[
+                    "No successful inserts found to continue UPSERT. Falling back to INSERT instead."
+                ]
             )
-            return self.trigger_insert_worksheet_import()
 
-        successful_update_imports = self.fetch_past_successful_imports(import_type=UPDATE)
-        update_csv_geneator = (
-            frappe.get_doc(doctype="File", file_url=x.import_file, file_name="").get_content()
-            for x in successful_update_imports
-        )
+        # compare remote csv with the imported state to calculate updates
+        equivalent_remote_rows = self.iter_remote_rows(end_row=self.counter)
+        if (remote_header_row := next(equivalent_remote_rows, None)) is None:
+            return WorksheetImport(UPDATE, [], ["No data found to import."])
 
-        insert_csv_generator = (
-            frappe.get_doc(doctype="File", file_url=x.import_file, file_name="").get_content()
-            for x in successful_insert_imports
+        # resolved from the header fetched along with the rows, it's stored after the first run
+        id_field_remote_index = remote_header_row.index(
+            self.get_worksheet_id_field(remote_header_row)
+        )
+        # the fingerprints are of normalized rows, if `normalize_values` is set
+        messages = []
+        equivalent_remote_rows = self.normalize_rows(
+            remote_header_row, zip(count(2), equivalent_remote_rows), messages
         )
 
-        # 1. generate csv file with all the inserted data imported
-        data_imported_csv = ""
-        for csv_file in insert_csv_generator:  # order of imports (first to last)
-            if not data_imported_csv:
-                data_imported_csv = csv_file
-            else:
-                data_imported_csv += "\n" + csv_file.split("\n", 1)[-1]
+        with stage("diff"):
+            row_diff = diff_rows(
+                imported_fingerprints,
+                equivalent_remote_rows,
+                id_field_remote_index,
+                get_row=itemgetter(1),
+            )
+        available_data_updates = [*row_diff.changed, *row_diff.inserted]
 
-        data_imported_csv_file = list(csv_reader(StringIO(data_imported_csv)))
-        data_imported_csv_file_header = data_imported_csv_file[0]
-        id_field_imported_index = data_imported_csv_file_header.index(self.worksheet_id_field)
+        if available_data_updates:
+            import_files, shard_row_numbers = self.write_update_import_files(
+                remote_header_row, available_data_updates, id_field_remote_index
+            )
+            return WorksheetImport(UPDATE, import_files, messages, shard_row_numbers)
 
-        # 2. apply updates captured over the csv file
-        for csv_file in update_csv_geneator:
-            update_csv_reader = csv_reader(StringIO(csv_file))
+        return self.prepare_insert_worksheet_import(
+            messages=[
+                *messages,
+                "No updates found to continue UPSERT. Falling back to INSERT instead.",
+            ]
+        )
 
-            header_row = next(update_csv_reader)
-            id_field_index = header_row.index(self.worksheet_id_field)
+    def rebuild_imported_fingerprints(self) -> tuple[dict[str, str], str | None] | None:
+        """Reconstructs the imported state from all past successful Data Imports, returning its
+        fingerprints along with the last import they include. Returns None if nothing has been
+        imported yet. Only required for worksheets imported before fingerprints were tracked."""
+        successful_insert_imports = self.fetch_past_successful_imports(import_type=INSERT)
 
-            for update_row in update_csv_reader:
-                for idx, data_row in enumerate(data_imported_csv_file):
-                    if update_row[id_field_index] == data_row[id_field_imported_index]:
-                        data_imported_csv_file[idx] = update_row
-                        continue
+        if not successful_insert_imports and not self.baseline_file:
+            return None
 
-        # Hack! use csv module to convert list to csv later
-        data_imported_csv = [",".join(x) for x in data_imported_csv_file]
+        successful_update_imports = self.fetch_past_successful_imports(import_type=UPDATE)
+        update_csv_geneator = self.iter_import_file_contents(successful_update_imports)
 
-        # 3. compare generated csv with remote csv to calculate updates
-        equivalent_remote_csv = self.fetch_remote_worksheet().splitlines()[: self.counter]
+        # the baseline holds the state of the imports compacted into it, see `compact_imports`
+        insert_csv_generator = chain(
+            self.get_baseline_contents(), self.iter_import_file_contents(successful_insert_imports)
+        )
 
-        diff_opcodes = SequenceMatcher(
-            None, data_imported_csv, equivalent_remote_csv
-        ).get_grouped_opcodes(0)
-        diff_slices = [y[3:5] for y in [x[1] for x in diff_opcodes]]
+        id_field = self.get_worksheet_id_field(self.remote_header_row)
+        data_imported_csv_file = replay_imports(
+            insert_csv_generator, update_csv_geneator, id_field=id_field
+        )
+        if not data_imported_csv_file:
+            return None
+        id_field_imported_index = data_imported_csv_file[0].index(id_field)
+
+        fingerprints = fingerprint_rows(data_imported_csv_file[1:], id_field_imported_index)
+        last_import = (successful_update_imports or successful_insert_imports or [None])[-1]
+        return fingerprints, last_import.name if last_import else self.baseline_import
+
+    def iter_import_file_contents(self, data_imports: list[dict]) -> Iterator[str]:
+        for data_import in data_imports:
+            yield frappe.get_doc(
+                doctype="File", file_url=data_import.import_file, file_name=""
+            ).get_content()
+
+    def get_baseline_contents(self) -> list[str]:
+        if not self.baseline_file:
+            return []
+        file_doc = frappe.get_doc("File", {"file_url": self.baseline_file})
+        return [read_csv_file(file_doc.get_full_path())]
+
+    def compact_imports(self, before=None):
+        """Folds the baseline file & the successful imports created before `before` into a new,
+        gzipped baseline file holding only the latest state of every row. The folded imports' files
+        are deleted, so rebuilding the imported state reads the baseline & the imports since."""
+        # the import files of Insert mappings are only replayed once they're switched to Upsert &
+        # may have no ID column
+        if self.get_import_type() != UPSERT:
+            return
+
+        # chunks past the counter may still be retried & imports still running would be folded
+        # out of order
+        if self.get_outstanding_imports() or frappe.db.exists(
+            "Data Import", {"worksheet_id": self.name, "status": "Pending"}
+        ):
+            return
+
+        insert_imports = self.fetch_past_successful_imports(INSERT, before=before)
+        update_imports = self.fetch_past_successful_imports(UPDATE, before=before)
+        if not (insert_imports or update_imports) or not (insert_imports or self.baseline_file):
+            return
+
+        insert_csvs = chain(
+            self.get_baseline_contents(), self.iter_import_file_contents(insert_imports)
+        )
+        first_csv = next(insert_csvs)
+        id_field = self.get_worksheet_id_field(next(csv_reader(StringIO(first_csv)), []))
+        imported_rows = replay_imports(
+            chain([first_csv], insert_csvs),
+            self.iter_import_file_contents(update_imports),
+            id_field=id_field,
+        )
+        if not imported_rows:
+            return
+
+        baseline = write_csv_file(
+            frappe.get_site_path(
+                "private",
+                "files",
+                f"{self.parent_doc.sheet_name}-worksheet-{self.worksheet_id}-baseline-"
+                f"{frappe.generate_hash(length=6)}.csv.gz",
+            ),
+            (row for row in imported_rows if not is_empty_row(row)),
+            compress=True,
+        )
+        baseline_file = self.attach_csv_file(baseline, self.doctype, self.name, "baseline_file")
+        last_import = max(insert_imports + update_imports, key=lambda x: x.creation)
+
+        if not has_row_fingerprints(self.name):
+            id_field_index = imported_rows[0].index(id_field)
+            set_row_fingerprints(
+                self.name,
+                fingerprint_rows(imported_rows[1:], id_field_index),
+                data_import=last_import.name,
+            )
 
-        available_data_updates = data_imported_csv[:1] + [
-            item
-            for sublist in [equivalent_remote_csv[slice(*x)] for x in diff_slices]
-            for item in sublist
-        ]
+        previous_baseline_file = self.baseline_file
+        self.db_set(
+            {
+                "baseline_file": baseline_file.file_url,
+                "baseline_import": last_import.name,
+                "id_field": id_field,
+            },
+            update_modified=False,
+        )
 
-        if len(available_data_updates) > 1:
-            di = self.create_data_import("\n".join(available_data_updates), import_type=UPDATE)
-            di.start_import()
-            self.last_update_import = di.name
-            self.save()
-        else:
+        for data_import in insert_imports + update_imports:
+            frappe.db.set_value(
+                "Data Import", data_import.name, "import_file", None, update_modified=False
+            )
+            self.delete_file(data_import.import_file)
+        if previous_baseline_file:
+            self.delete_file(previous_baseline_file)
+
+    def delete_file(self, file_url: str):
+        for file_name in frappe.get_all("File", filters={"file_url": file_url}, pluck="name"):
+            frappe.delete_doc("File", file_name, ignore_permissions=True)
+
+    def update_row_fingerprints(self, data_import: "DataImport"):
+        """Folds the rows imported successfully via `data_import` into the worksheet's fingerprints"""
+        # imports compacted into the baseline file have their fingerprints set by the compaction
+        if data_import.row_fingerprints_updated or not data_import.import_file:
+            return
+
+        # Insert mappings need no ID column, their fingerprints are rebuilt from the imports if
+        # they're switched to Upsert. Existing ones are kept complete.
+        if self.get_import_type() != UPSERT and not has_row_fingerprints(self.name):
+            return
+
+        # fingerprints of older imports don't exist yet, they'll be rebuilt along with this
+        # import's on the next Upsert
+        if not has_row_fingerprints(self.name) and frappe.db.exists(
+            "Data Import",
+            {
+                "worksheet_id": self.name,
+                "status": ("in", ACCEPTABLE_IMPORT_STATUSES),
+                "name": ("!=", data_import.name),
+            },
+        ):
+            return
+
+        csv_file = frappe.get_doc(
+            doctype="File", file_url=data_import.import_file, file_name=""
+        ).get_content()
+        import_csv_reader = csv_reader(StringIO(csv_file))
+        header_row = next(import_csv_reader)
+        id_field_index = header_row.index(self.get_worksheet_id_field(header_row))
+        failed_row_numbers = get_failed_row_numbers(data_import.name)
+
+        fingerprints = fingerprint_rows(
+            (
+                row
+                for row_number, row in enumerate(import_csv_reader, start=2)
+                if row_number not in failed_row_numbers
+            ),
+            id_field_index,
+        )
+        set_row_fingerprints(self.name, fingerprints, data_import=data_import.name)
+        data_import.db_set("row_fingerprints_updated", 1, update_modified=False)
+
+    def get_import_status_ranges(self) -> tuple[list[str], list[dict]]:
+        """Returns the Data Imports whose results are yet to be written back, along with the value
+        ranges writing those results to the status column of the worksheet"""
+        data_imports = frappe.get_all(
+            "Data Import",
+            filters={"worksheet_id": self.name, "write_back_pending": 1},
+            fields=[
+                "name",
+                "status",
+                "worksheet_row_start",
+                "worksheet_row_count",
+                "worksheet_row_numbers",
+            ],
+            order_by="creation",
+        )
+        if not data_imports:
+            return [], []
+
+        header_row = self.remote_header_row
+        if self.status_column not in header_row:
             frappe.msgprint(
-                "No updates found to continue UPSERT. Falling back to INSERT instead.",
+                f"Status Column {self.status_column} not found in the header of worksheet"
+                f" {self.worksheet_id}. Import statuses are written once it's added.",
                 alert=True,
                 indicator="orange",
             )
-            return self.trigger_insert_worksheet_import()
+            return [], []
+
+        # later imports of a row overwrite the statuses of earlier ones
+        statuses = {}
+        for data_import in data_imports:
+            statuses.update(get_import_statuses(data_import))
+
+        column = get_column_letter(header_row.index(self.status_column) + 1)
+        title = self.get_remote_worksheet().title
+        value_ranges = [
+            {
+                "range": absolute_range_name(title, f"{column}{first}:{column}{last}"),
+                "values": [[statuses[row_number]] for row_number in range(first, last + 1)],
+            }
+            for first, last in get_column_runs(sorted(statuses))
+        ]
+        return [x.name for x in data_imports], value_ranges
+
+    def prepare_insert_worksheet_import(
+        self, messages: list[str] | None = None
+    ) -> WorksheetImport:
+        if outstanding_imports := self.get_outstanding_imports():
+            pending_import = next(
+                (x for x in outstanding_imports if x.status not in ACCEPTABLE_IMPORT_STATUSES),
+                outstanding_imports[0],
+            )
+            frappe.throw(
+                f"Skipping import as {len(outstanding_imports)} chunk(s) of earlier imports are "
+                "yet to be imported. "
+                f"{get_link_to_form('Data Import', pending_import.name)} has status "
+                f"'{pending_import.status}', retry it if it failed."
+            )
 
-    def trigger_insert_worksheet_import(self):
         if self.last_import:
             last_data_import_status = frappe.db.get_value(
                 "Data Import", self.last_import, "status"
@@ -144,20 +541,59 @@ class DocTypeWorksheetMapping(Document):
                     "Contact Sheets Support if you need to enable this feature."
                 )
 
-        data = self.fetch_remote_spreadsheet()
+        messages = list(messages or [])
+        new_rows = self.iter_new_remote_rows()
+        if (header_row := next(new_rows, None)) is None:
+            return WorksheetImport(INSERT, [], messages)
 
-        # length includes header row
-        if (counter := len(data.splitlines())) > 1:
-            di = self.create_data_import(data)
-            frappe.enqueue_doc(
-                di.doctype, di.name, method="start_import", enqueue_after_commit=True
+        first_row = 2 if self.reset_worksheet_on_import else self.get_next_row()
+        new_rows = (
+            row
+            for _, row in self.normalize_rows(
+                header_row, zip(count(first_row), new_rows), messages
             )
-            self.last_import = di.name
-            self.counter = (self.counter or 1) + (counter - 1)  # subtract header row
-        else:
-            frappe.msgprint("No data found to import.", alert=True, indicator="orange")
+        )
+        with stage("write"):
+            import_files = write_csv_chunks(
+                self.get_import_file_path, header_row, new_rows, self.import_chunk_size
+            )
+        record_rows(written=sum(x.row_count - 1 for x in import_files))
+        return WorksheetImport(INSERT, import_files, messages)
+
+    def normalize_rows(
+        self,
+        header_row: list[str],
+        numbered_rows: Iterable[tuple[int, list[str]]],
+        messages: list[str],
+    ) -> Iterator[tuple[int, list[str]]]:
+        """Yields the (worksheet row number, row) pairs of `numbered_rows` with the rows normalized
+        to the types of the fields they're mapped to, if `normalize_values` is set. Rejected rows
+        are yielded empty, keeping the positions of the rows for `counter`, & listed in `messages`
+        once all rows are consumed."""
+        if not self.normalize_values:
+            yield from numbered_rows
+            return
+
+        normalizer = RowNormalizer(self.mapped_doctype, header_row)
+        yield from normalizer.normalize(numbered_rows)
+        messages.extend(normalizer.get_messages())
+
+    @cached_property
+    def import_chunk_size(self) -> int:
+        return cint(frappe.conf.sheets_import_chunk_size) or IMPORT_CHUNK_SIZE
 
-        return self.save()
+    def validate_bulk_import(self):
+        if not self.bulk_import:
+            return
+
+        if self.get_import_type() != INSERT:
+            frappe.throw("Bulk Import is only available for the Insert import type")
+
+        if issues := get_bulk_import_issues(self.mapped_doctype):
+            frappe.throw(
+                f"Bulk Import isn't allowed for {self.mapped_doctype}:<br>" + "<br>".join(issues),
+                title="Bulk Import not allowed",
+            )
 
     def get_import_type(self):
         match self.import_type:
@@ -171,7 +607,43 @@ class DocTypeWorksheetMapping(Document):
     def generate_import_file_name(self):
         return f"{self.parent_doc.sheet_name}-worksheet-{self.worksheet_id}-{frappe.generate_hash(length=6)}.csv"
 
-    def create_data_import(self, data: str, import_type=INSERT) -> "DataImport":
+    def get_import_file_path(self) -> str:
+        return frappe.get_site_path("private", "files", self.generate_import_file_name())
+
+    def write_import_file(self, rows: Iterable[list[str]]) -> CSVFile:
+        """Streams `rows` into a new private csv file on disk, without holding them in memory"""
+        with stage("write"):
+            import_file = write_csv_file(self.get_import_file_path(), rows)
+        record_rows(written=import_file.row_count - 1)
+        return import_file
+
+    def write_update_import_files(
+        self,
+        header_row: list[str],
+        numbered_rows: list[tuple[int, list[str]]],
+        id_field_index: int,
+    ) -> tuple[list[CSVFile], list[list[int] | None]]:
+        """Writes the rows to update into an import file per shard, along with the worksheet rows
+        of each file's rows if `write_back_status` is set. Rows are sharded by their key, so the
+        rows of a key are always updated by the same shard & the shards' fingerprints never
+        overlap."""
+        shards = [[] for _ in range(self.get_update_shard_count(len(numbered_rows)))]
+        for row_number, row in numbered_rows:
+            shards[get_row_shard(row, id_field_index, len(shards))].append((row_number, row))
+        shards = [shard for shard in shards if shard]
+
+        import_files = [
+            self.write_import_file([header_row, *(row for _, row in shard)]) for shard in shards
+        ]
+        if not self.write_back_status:
+            return import_files, [None] * len(shards)
+        return import_files, [[row_number for row_number, _ in shard] for shard in shards]
+
+    def get_update_shard_count(self, row_count: int) -> int:
+        max_shards = cint(frappe.conf.sheets_update_shards) or UPDATE_SHARDS
+        return max(1, min(max_shards, row_count // UPDATE_SHARD_MIN_ROWS))
+
+    def new_data_import(self, import_type=INSERT) -> "DataImport":
         data_import = frappe.new_doc("Data Import")
         data_import.update(
             {
@@ -181,55 +653,282 @@ class DocTypeWorksheetMapping(Document):
                 "submit_after_import": self.submit_after_import,
             }
         )
+        return data_import
+
+    def create_parent_import(self) -> str:
+        """Creates the Data Import tracking the shards of an update, without an import file of its
+        own. It stays Pending until all its shards have finished."""
+        data_import = self.new_data_import(import_type=UPDATE)
+        data_import.spreadsheet_id = self.parent_doc.name
+        data_import.worksheet_id = self.name
+        return data_import.save().name
+
+    def create_data_import(
+        self,
+        import_file: CSVFile,
+        import_type=INSERT,
+        row_start: int | None = None,
+        row_numbers: list[int] | None = None,
+        parent_import: str | None = None,
+    ) -> "DataImport":
+        data_import = self.new_data_import(import_type=import_type)
         data_import.save()
 
-        import_file = frappe.new_doc("File")
-        import_file.update(
-            {
-                "attached_to_doctype": data_import.doctype,
-                "attached_to_name": data_import.name,
-                "attached_to_field": "import_file",
-                "file_name": self.generate_import_file_name(),
-                "is_private": 1,
-            }
+        file_doc = self.attach_csv_file(
+            import_file, data_import.doctype, data_import.name, "import_file"
         )
-        import_file.content = data.encode("utf-8")
-        import_file.save()
 
         data_import.spreadsheet_id = self.parent_doc.name
         data_import.worksheet_id = self.name
-        data_import.import_file = import_file.file_url
+        data_import.import_file = file_doc.file_url
+        if row_start:
+            data_import.worksheet_row_start = row_start
+            data_import.worksheet_row_count = import_file.row_count - 1
+        if row_numbers:
+            data_import.worksheet_row_numbers = json.dumps(row_numbers)
+        if parent_import:
+            data_import.parent_import = parent_import
 
         return data_import.save()
 
-    def fetch_remote_worksheet(self):
-        remote_spreadsheet = self.parent_doc.get_sheet_client().open_by_url(
-            self.parent_doc.sheet_url
+    def attach_csv_file(
+        self, csv_file: CSVFile, doctype: str, name: str, fieldname: str
+    ) -> "File":
+        file_name = os.path.basename(csv_file.path)
+        file_doc = frappe.new_doc("File")
+        file_doc.update(
+            {
+                "attached_to_doctype": doctype,
+                "attached_to_name": name,
+                "attached_to_field": fieldname,
+                "file_name": file_name,
+                "file_url": f"/private/files/{file_name}",
+                "folder": "Home/Attachments",
+                "is_private": 1,
+                "content_hash": csv_file.content_hash,
+                "file_size": csv_file.file_size,
+            }
         )
-        remote_worksheet = remote_spreadsheet.get_worksheet_by_id(self.worksheet_id)
+        # the content is already written to disk, File.save would read it all back into memory
+        file_doc.db_insert()
+        return file_doc
 
-        buffer = StringIO()
-        csv_writer(buffer).writerows(remote_worksheet.get_all_values())
-        return buffer.getvalue()
+    def get_remote_worksheet(self) -> "gs.Worksheet":
+        return self.parent_doc.get_remote_worksheet(self.worksheet_id)
 
-    def fetch_remote_spreadsheet(self) -> str:
-        full_sheet_content = self.fetch_remote_worksheet()
-        counter = 0 if self.reset_worksheet_on_import else self.counter
+    def iter_remote_rows(
+        self, start_row: int = 1, end_row: int | None = None, width: int = 0
+    ) -> Iterator[list[str]]:
+        """Yields rows of the remote worksheet from `start_row` till `end_row` (1-indexed, both
+        inclusive), fetching FETCH_BATCH_SIZE rows per request. Rows are padded to `width` cells,
+        which defaults to the width of the first row fetched."""
+        remote_worksheet = self.get_remote_worksheet()
+        end_row = min(end_row or remote_worksheet.row_count, remote_worksheet.row_count)
 
-        if counter:
-            full_sheet_lines = full_sheet_content.splitlines()
-            return "\n".join(full_sheet_lines[:1] + full_sheet_lines[counter:])
-        return full_sheet_content
+        # empty rows are only yielded once followed by data, like get_all_values does
+        empty_rows = 0
+
+        for batch_start in range(start_row, end_row + 1, self.fetch_batch_size):
+            batch_end = min(batch_start + self.fetch_batch_size - 1, end_row)
+            values = self.fetch_remote_values(batch_start, batch_end)
+
+            for row in values:
+                if not any(row):
+                    empty_rows += 1
+                    continue
+
+                width = width or len(row)
+                for _ in range(empty_rows):
+                    yield [""] * width
+                empty_rows = 0
+
+                yield row + [""] * (width - len(row))
+
+            # trailing empty rows of a range are trimmed in the API response
+            empty_rows += (batch_end - batch_start + 1) - len(values)
 
     @cached_property
-    def worksheet_id_field(self) -> str:
-        worksheet_gdoc = (
-            self.parent_doc.get_sheet_client()
-            .open_by_url(self.parent_doc.sheet_url)
-            .get_worksheet_by_id(self.worksheet_id)
+    def fetch_batch_size(self) -> int:
+        return cint(frappe.conf.sheets_fetch_batch_size) or FETCH_BATCH_SIZE
+
+    def get_range_name(self, start_row: int, end_row: int) -> str:
+        last_column = get_column_letter(self.get_remote_worksheet().col_count)
+        return f"A{start_row}:{last_column}{end_row}"
+
+    def get_range_names(
+        self, start_row: int, end_row: int, projected: bool = True
+    ) -> tuple[str, ...]:
+        """Returns the ranges to fetch for the rows, one per run of adjacent columns to fetch if
+        only some are, see `mapped_column_indexes`, & `projected`, else a single range over all
+        columns"""
+        if not projected or self.mapped_column_runs is None:
+            return (self.get_range_name(start_row, end_row),)
+
+        return tuple(
+            f"{get_column_letter(first + 1)}{start_row}:{get_column_letter(last + 1)}{end_row}"
+            for first, last in self.mapped_column_runs
+        )
+
+    def fetch_remote_rows(self, row_numbers: list[int]) -> Iterator[list[str]]:
+        """Yields the given rows of the remote worksheet, padded to the header's width. All of them
+        are fetched in a single values.batchGet request, one range per run of adjacent rows."""
+        width = len(self.import_header_row)
+        row_runs = get_column_runs(row_numbers)
+        self.parent_doc.batch_get_values(
+            [(self, self.get_range_names(first, last)) for first, last in row_runs]
+        )
+
+        for first, last in row_runs:
+            values = self.fetch_remote_values(first, last)
+            # trailing empty rows of a run are trimmed in the API response
+            for row in chain(values, [[]] * (last - first + 1 - len(values))):
+                yield row + [""] * (width - len(row))
+
+    def fetch_remote_values(
+        self, start_row: int, end_row: int, projected: bool = True
+    ) -> list[list[str]]:
+        range_names = self.get_range_names(start_row, end_row, projected)
+        prefetched_values = self.__dict__.get("_prefetched_values", {})
+
+        if (values := prefetched_values.pop(range_names, None)) is None:
+            remote_worksheet = self.get_remote_worksheet()
+            with stage("fetch"):
+                if len(range_names) == 1:
+                    values = remote_worksheet.get_values(range_names[0])
+                else:
+                    response = self.parent_doc.get_remote_spreadsheet().values_batch_get(
+                        [absolute_range_name(remote_worksheet.title, x) for x in range_names]
+                    )
+                    values = self.merge_value_ranges(
+                        [x.get("values", []) for x in response["valueRanges"]]
+                    )
+
+        record_rows(fetched=len(values))
+        return values
+
+    def merge_value_ranges(self, value_ranges: list[list[list[str]]]) -> list[list[str]]:
+        """Joins the values fetched for the ranges of `get_range_names` into rows"""
+        if len(value_ranges) == 1:
+            return value_ranges[0]
+        return merge_column_ranges(
+            value_ranges, [last - first + 1 for first, last in self.mapped_column_runs]
         )
-        header_row = worksheet_gdoc.row_values(1)
 
+    def get_prefetch_ranges(self) -> list[tuple[int, int]]:
+        """Returns the row ranges of the first requests the next import of this worksheet makes, for
+        SpreadSheet.prefetch_remote_values to fetch them along with the other worksheets'"""
+        row_count = self.get_remote_worksheet().row_count
+        counter = 0 if self.reset_worksheet_on_import else self.counter
+
+        if self.get_import_type() == UPSERT and counter:
+            start_row, end_row = 1, min(counter, row_count)
+        elif counter <= 1:
+            start_row, end_row = 1, row_count
+        elif counter < row_count:
+            start_row, end_row = counter + 1, row_count
+        else:
+            return []
+
+        ranges = [(start_row, min(start_row + self.fetch_batch_size - 1, end_row))]
+        # the header row is prefetched on its own when fetching some columns only
+        if start_row > 1 and not self.projects_columns:
+            ranges.insert(0, (1, 1))
+        return ranges
+
+    def set_prefetched_values(self, range_names: tuple[str, ...], values: list[list[str]]):
+        self.__dict__.setdefault("_prefetched_values", {})[range_names] = values
+
+    def clear_remote_cache(self):
+        for attr in (
+            "_prefetched_values",
+            "remote_header_row",
+            "mapped_column_indexes",
+            "mapped_column_runs",
+        ):
+            self.__dict__.pop(attr, None)
+
+    def iter_new_remote_rows(self) -> Iterator[list[str]]:
+        """Yields the header row followed by the rows not yet imported from the remote worksheet.
+        Only the rows after `counter` are requested, the header is fetched only if any exist."""
+        counter = 0 if self.reset_worksheet_on_import else self.counter
+
+        if counter <= 1:
+            yield from self.iter_remote_rows()
+            return
+
+        new_rows = self.iter_remote_rows(start_row=counter + 1)
+        if (first_row := next(new_rows, None)) is None:
+            return
+
+        header_row = self.import_header_row
+        yield header_row
+        for row in chain([first_row], new_rows):
+            yield row + [""] * (len(header_row) - len(row))
+
+    @cached_property
+    def remote_header_row(self) -> list[str]:
+        # always fetched in full, the mapped columns are worked out from it
+        return next(iter(self.fetch_remote_values(1, 1, projected=False)), [])
+
+    @property
+    def import_header_row(self) -> list[str]:
+        if self.mapped_column_indexes is None:
+            return self.remote_header_row
+        return project_row(self.remote_header_row, self.mapped_column_indexes)
+
+    @property
+    def projects_columns(self) -> bool:
+        """Whether only some of the remote columns are fetched, worked out from the header row"""
+        return bool(self.fetch_mapped_columns_only or self.write_back_status)
+
+    @cached_property
+    def mapped_column_indexes(self) -> list[int] | None:
+        """Returns the indexes of the remote columns to fetch, if not all of them: the ones the
+        Importer maps to fields of the mapped DocType with `fetch_mapped_columns_only`, as columns
+        not matching any field are skipped by the Importer anyway, & all but the status column
+        with `write_back_status`, so that writing the statuses doesn't change the rows."""
+        if not self.projects_columns:
+            return None
+
+        header_row = self.remote_header_row
+        if self.fetch_mapped_columns_only:
+            indexes = [
+                idx
+                for idx, column in enumerate(header_row)
+                if column
+                and (
+                    column == self.id_field
+                    or get_df_for_column_header(self.mapped_doctype, column)
+                )
+            ]
+        else:
+            indexes = list(range(len(header_row)))
+
+        if self.write_back_status:
+            indexes = [idx for idx in indexes if header_row[idx] != self.status_column]
+        return indexes or None
+
+    @cached_property
+    def mapped_column_runs(self) -> list[tuple[int, int]] | None:
+        if self.mapped_column_indexes is None:
+            return None
+        return get_column_runs(self.mapped_column_indexes)
+
+    def get_worksheet_id_field(self, header_row: list[str]) -> str:
+        """Returns the column identifying rows in `header_row`. It's resolved from the header once
+        & stored in `id_field`, which may also be set to pin the column."""
+        if self.id_field:
+            if self.id_field not in header_row:
+                frappe.throw(
+                    f"ID Field {self.id_field} not found in the header of worksheet"
+                    f" {self.worksheet_id}. Update or clear it to resolve the ID Field again."
+                )
+            return self.id_field
+
+        self.id_field = self.find_worksheet_id_field(header_row)
+        return self.id_field
+
+    def find_worksheet_id_field(self, header_row: list[str]) -> str:
         if "ID" in header_row:
             return "ID"
 
@@ -244,5 +943,64 @@ class DocTypeWorksheetMapping(Document):
             if field in header_row:
                 return field
 
-        # Note: Should we provide a `self.id_field` field to allow users to specify the ID field?
         frappe.throw(f"Could not find ID or Unique field in {self.doctype}")
+
+
+def get_worksheet(name: str) -> DocTypeWorksheetMapping:
+    """Returns the mapping loaded through its SpreadSheet, which it accesses as `parent_doc`"""
+    spreadsheet = frappe.db.get_value("DocType Worksheet Mapping", name, "parent")
+    return frappe.get_doc("SpreadSheet", spreadsheet).get("worksheet_ids", {"name": name})[0]
+
+
+def get_failed_row_numbers(data_import: str) -> set[int]:
+    failed_row_indexes = frappe.get_all(
+        "Data Import Log",
+        filters={"data_import": data_import, "success": 0},
+        pluck="row_indexes",
+    )
+    return {row_number for x in failed_row_indexes for row_number in json.loads(x or "[]")}
+
+
+def get_import_statuses(data_import: dict) -> dict[int, str]:
+    """Returns the results of the rows of `data_import` by their worksheet row numbers. Rows of
+    imports that didn't record their worksheet rows are left out."""
+    if data_import.worksheet_row_numbers:
+        worksheet_rows = json.loads(data_import.worksheet_row_numbers)
+    elif data_import.worksheet_row_start:
+        row_start = data_import.worksheet_row_start
+        worksheet_rows = range(row_start, row_start + cint(data_import.worksheet_row_count))
+    else:
+        return {}
+
+    # rows of imports failing as a whole may have no logs
+    statuses = {}
+    if data_import.status == "Error":
+        statuses = dict.fromkeys(worksheet_rows, f"Failed: {data_import.name} failed")
+
+    for log in frappe.get_all(
+        "Data Import Log",
+        filters={"data_import": data_import.name},
+        fields=["success", "docname", "row_indexes", "messages", "exception"],
+        order_by="log_index",
+    ):
+        status = f"Imported {log.docname}" if log.success else f"Failed: {get_log_error(log)}"
+        # row indexes count the header row of the import file as 1
+        for row_index in json.loads(log.row_indexes or "[]"):
+            if 0 <= row_index - 2 < len(worksheet_rows):
+                statuses[worksheet_rows[row_index - 2]] = status
+
+    return statuses
+
+
+def get_log_error(log: dict) -> str:
+    if messages := json.loads(log.messages or "[]"):
+        # messages are logged as dicts or as their JSON
+        message = messages[-1]
+        if isinstance(message, str) and message.startswith("{"):
+            message = json.loads(message)
+        if isinstance(message, dict):
+            message = message.get("message")
+    else:
+        message = next(reversed((log.exception or "").strip().splitlines()), "Import failed")
+
+    return strip_html(cstr(message)).strip()[:STATUS_MESSAGE_LENGTH]
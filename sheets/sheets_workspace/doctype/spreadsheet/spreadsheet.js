@@ -55,6 +55,14 @@ frappe.ui.form.on("SpreadSheet", {
         frm.trigger("import_frequency");
     },
     refresh(frm) {
+        const sync_state = frm.doc.__onload?.sync_state;
+        if (["Queued", "Fetching", "Importing"].includes(sync_state?.state)) {
+            frm.set_intro(
+                `Sync ${sync_state.state.toLowerCase()} since ${sync_state.updated_at}`,
+                "blue"
+            );
+        }
+
         // workaround for highlighting status - frm.set_indicator_formatter didn't work?
         frm.fields_dict.worksheet_ids.grid.grid_rows.forEach((row, idx) => {
             const child = frm.doc.worksheet_ids[idx];
@@ -78,7 +86,7 @@ frappe.ui.form.on("SpreadSheet", {
         });
 
         frm.add_custom_button("Trigger Import", () => {
-            frm.call("trigger_import");
+            frm.call("trigger_import", { force: 1 });
         });
     },
 });
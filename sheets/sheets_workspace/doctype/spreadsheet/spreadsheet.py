@@ -1,34 +1,53 @@
 # Copyright (c) 2023, Gavin D'souza and contributors
 # For license information, please see license.txt
 
-from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from time import perf_counter
 from typing import TYPE_CHECKING
 
 import frappe
 import gspread as gs
 from croniter import croniter
 from frappe.model.document import Document
-from frappe.utils import get_link_to_form
+from frappe.utils import cint, get_link_to_form, now_datetime
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import absolute_range_name, extract_id_from_url
 
-import sheets
-from sheets.api import describe_cron, get_all_frequency
-from sheets.overrides import update_record_patch
+from sheets.api import CRON_MAP, describe_cron, get_all_frequency
+from sheets.client import get_sheet_client
+from sheets.constants import IMPORT_WORKERS
+from sheets.profiling import SyncStats, capture_profile, stage, use_sync_stats
+from sheets.scheduler import get_next_sync_time
+from sheets.sheets_workspace.doctype.spreadsheet_sync_log.spreadsheet_sync_log import (
+    create_sync_log,
+)
+from sheets.sync_state import (
+    DONE,
+    FAILED,
+    IMPORTING,
+    get_sync_state,
+    request_sync_rerun,
+    start_sync_run,
+)
+from sheets.utils import submit_in_site
 
 if TYPE_CHECKING:
-    from frappe.core.doctype.file import File
-
     from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
         DocTypeWorksheetMapping,
+        WorksheetImport,
     )
 
 
 class SpreadSheet(Document):
     worksheet_ids: "list[DocTypeWorksheetMapping]"
-    server_script: str
     frequency_cron = str
     import_frequency: str
     sheet_url: str
     sheet_name: str
+    last_modified_time: str
+    next_sync_at: str
+    poll_backoff: int
 
     @property
     def frequency_description(self):
@@ -42,21 +61,107 @@ class SpreadSheet(Document):
             case _:
                 return describe_cron(self.import_frequency)
 
+    def get_import_cron(self) -> str | None:
+        match self.import_frequency:
+            case None | "":
+                return None
+            case "Custom":
+                return self.frequency_cron
+            case "Frequently":
+                return f"*/{get_all_frequency()} * * * *"
+            case _:
+                return CRON_MAP[self.import_frequency]
+
+    def onload(self):
+        self.set_onload("sync_state", get_sync_state(self.name))
+
     def get_sheet_client(self):
-        if not hasattr(self, "_gc"):
-            file: "File" = frappe.get_cached_doc(
-                "File",
-                {
-                    "attached_to_doctype": sheets.SHEETS_SETTINGS,
-                    "attached_to_name": sheets.SHEETS_SETTINGS,
-                    "attached_to_field": sheets.SHEETS_CREDENTIAL_FIELD,
-                },
+        return get_sheet_client()
+
+    def get_remote_spreadsheet(self) -> "gs.Spreadsheet":
+        if not hasattr(self, "_remote_spreadsheet"):
+            with stage("metadata"):
+                self._remote_spreadsheet = self.get_sheet_client().open_by_url(self.sheet_url)
+        return self._remote_spreadsheet
+
+    def get_remote_worksheets(self) -> "dict[str, gs.Worksheet]":
+        # all worksheet handles are built from a single metadata request & shared by the mappings
+        if not hasattr(self, "_remote_worksheets"):
+            remote_spreadsheet = self.get_remote_spreadsheet()
+            with stage("metadata"):
+                self._remote_worksheets = {str(w.id): w for w in remote_spreadsheet.worksheets()}
+        return self._remote_worksheets
+
+    def get_remote_worksheet(self, worksheet_id: int | str) -> "gs.Worksheet":
+        if remote_worksheet := self.get_remote_worksheets().get(str(worksheet_id)):
+            return remote_worksheet
+        frappe.throw(f"Invalid Worksheet ID {worksheet_id}")
+
+    def prefetch_remote_values(self):
+        """Fetches the first batch of rows for every mapped worksheet in one values.batchGet
+        request. Each DocTypeWorksheetMapping only requests the following batches itself.
+        Worksheets fetching some of their columns only need their header rows for that, which are
+        fetched for all of them in one more request before, unless fetched by the write back."""
+        self.prefetch_header_rows(
+            [worksheet for worksheet in self.worksheet_ids if worksheet.projects_columns]
+        )
+        self.batch_get_values(
+            [
+                (worksheet, worksheet.get_range_names(start_row, end_row))
+                for worksheet in self.worksheet_ids
+                for start_row, end_row in worksheet.get_prefetch_ranges()
+            ]
+        )
+
+    def prefetch_header_rows(self, worksheets: "list[DocTypeWorksheetMapping]"):
+        self.batch_get_values(
+            [
+                (worksheet, worksheet.get_range_names(1, 1, projected=False))
+                for worksheet in worksheets
+                if "remote_header_row" not in worksheet.__dict__
+            ]
+        )
+
+    def batch_get_values(self, value_ranges: "list[tuple[DocTypeWorksheetMapping, tuple]]"):
+        """Fetches the ranges of all the worksheets in one request, setting the values on them"""
+        if not value_ranges:
+            return
+
+        range_names = [
+            absolute_range_name(worksheet.get_remote_worksheet().title, range_name)
+            for worksheet, worksheet_range_names in value_ranges
+            for range_name in worksheet_range_names
+        ]
+        remote_spreadsheet = self.get_remote_spreadsheet()
+        with stage("prefetch"):
+            response = remote_spreadsheet.values_batch_get(range_names)
+
+        response_values = (x.get("values", []) for x in response["valueRanges"])
+        for worksheet, worksheet_range_names in value_ranges:
+            values = [next(response_values) for _ in worksheet_range_names]
+            worksheet.set_prefetched_values(
+                worksheet_range_names, worksheet.merge_value_ranges(values)
+            )
+
+    def get_remote_modified_time(self) -> str:
+        # a single Drive metadata request, without opening the spreadsheet itself
+        with stage("metadata"):
+            response = self.get_sheet_client().request(
+                "get",
+                f"{DRIVE_FILES_API_V3_URL}/{extract_id_from_url(self.sheet_url)}",
+                params={"fields": "modifiedTime", "supportsAllDrives": True},
             )
-            self._gc = gs.service_account(file.get_full_path())
-        return self._gc
+        return response.json()["modifiedTime"]
+
+    def clear_remote_cache(self):
+        for attr in ("_remote_spreadsheet", "_remote_worksheets"):
+            self.__dict__.pop(attr, None)
+        for worksheet in self.worksheet_ids:
+            worksheet.clear_remote_cache()
 
     def validate(self):
         self.validate_base_settings()
+        self.validate_worksheet_settings()
         self.validate_sync_settings()
         self.validate_sheet_access()
 
@@ -73,57 +178,44 @@ class SpreadSheet(Document):
                 title="Sheet URL must be unique",
             )
 
+    def validate_worksheet_settings(self):
+        for worksheet in self.worksheet_ids:
+            worksheet.validate_bulk_import()
+
     def validate_sync_settings(self):
         # validate cron pattern
         if self.frequency_cron and self.import_frequency == "Custom":
             croniter(self.frequency_cron)
 
-        # setup server script
-        if self.sheet_name and (
-            self.has_value_changed("import_frequency") or self.has_value_changed("frequency_cron")
-        ):
-            script_name = f"SpreadSheet Import - {self.sheet_name}"
-
-            if self.import_frequency == "Custom":
-                event_frequency = "Cron"
-            elif self.import_frequency == "Frequently":
-                event_frequency = "All"
-            else:
-                event_frequency = self.import_frequency
-
-            if not self.server_script:
-                script = frappe.new_doc("Server Script").update(
-                    {
-                        "__newname": script_name,
-                        "script_type": "Scheduler Event",
-                        "script": f"frappe.get_doc('SpreadSheet', '{self.name}').trigger_import()",
-                        "event_frequency": event_frequency,
-                        "cron_format": self.frequency_cron,
-                    }
-                )
+        # scheduled imports are enqueued by sheets.scheduler.dispatch_syncs
+        if self.has_value_changed("import_frequency") or self.has_value_changed("frequency_cron"):
+            cron = self.get_import_cron()
+            self.next_sync_at = get_next_sync_time(cron, now_datetime()) if cron else None
+            self.poll_backoff = 0
 
-            else:
-                script = frappe.get_doc(
-                    "Server Script", self.server_script, for_update=True
-                ).update(
-                    {
-                        "event_frequency": event_frequency,
-                        "cron_format": self.frequency_cron,
-                    }
-                )
+    def schedule_next_sync(self, changed: bool | None = None):
+        """Sets when the sheet is polled next by the dispatcher. Polls finding the sheet unchanged
+        back off, each one doubling the gap till the next, while finding a change resets it.
+        `changed` is None for failed polls, which keep the current backoff."""
+        if not (cron := self.get_import_cron()):
+            return
 
-            script.disabled = not self.import_frequency
-            script.save()
-            self.server_script = script.name
+        if changed is not None:
+            self.poll_backoff = 0 if changed else cint(self.poll_backoff) + 1
+        self.db_set(
+            {
+                "next_sync_at": get_next_sync_time(cron, now_datetime(), cint(self.poll_backoff)),
+                "poll_backoff": self.poll_backoff,
+            },
+            update_modified=False,
+        )
 
     def validate_sheet_access(self):
-        sheet_client = self.get_sheet_client()
-
         try:
-            sheet = sheet_client.open_by_url(self.sheet_url)
+            sheet = self.get_remote_spreadsheet()
         except gs.exceptions.APIError as e:
             frappe.throw(
-                f"Share spreadsheet with the following Service Account Email and try again: <b>{sheet_client.auth.service_account_email}</b>",
+                f"Share spreadsheet with the following Service Account Email and try again: <b>{self.get_sheet_client().auth.service_account_email}</b>",
                 exc=e,
             )
         self._set_sheet_metadata(sheet)
@@ -133,7 +225,7 @@ class SpreadSheet(Document):
         self.sheet_name = self.sheet_name or sheet.title
 
         # set & validate worksheet ids
-        worksheet_ids = [str(w.id) for w in sheet.worksheets()]
+        worksheet_ids = list(self.get_remote_worksheets())
         if "gid=" in self.sheet_url:
             self.sheet_url, gid = self.sheet_url.split("gid=", 1)
             if gid not in worksheet_ids:
@@ -153,22 +245,199 @@ class SpreadSheet(Document):
             worksheet.counter = worksheet.counter or 1
 
     @frappe.whitelist()
-    def trigger_import(self):
-        with patch_importer():
-            for worksheet in self.worksheet_ids:
-                worksheet.trigger_worksheet_import()
-            self.save()
-        frappe.msgprint("Import Triggered Successfully", indicator="blue", alert=True)
+    def trigger_import(self, force: bool = False, profile: bool = False):
+        """Imports the worksheets' changes, recording the run in a SpreadSheet Sync Log. With
+        `profile`, the run is profiled with cProfile & worksheets are imported one at a time.
+        Triggers during another sync of the sheet are merged into one more sync after it."""
+        if (sync_run := start_sync_run(self.name)) is None:
+            request_sync_rerun(self.name)
+            self.flags.sync_skipped = True
+            state = (get_sync_state(self.name) or {}).get("state", "running")
+            frappe.msgprint(
+                f"The sheet is already being synced ({state.lower()}), it's synced again once done.",
+                alert=True,
+                indicator="blue",
+            )
+            return self
+
+        run_stats, started_at, start = SyncStats(), now_datetime(), perf_counter()
+        profiler = capture_profile(run_stats) if cint(profile) else nullcontext()
+        self.flags.sync_run = sync_run
+
+        try:
+            with use_sync_stats(run_stats), profiler:
+                import_summary = self.sync_worksheets(
+                    force=cint(force), max_workers=1 if cint(profile) else None
+                )
+        except Exception:
+            sync_run.finish(FAILED)
+            raise
+
+        # the lock is released once the run's changes are committed
+        failed = import_summary and any(x["status"] == "Failed" for x in import_summary)
+        sync_run.finish(FAILED if failed else DONE)
+
+        sync_log = create_sync_log(
+            self.name, started_at, perf_counter() - start, run_stats, import_summary
+        )
+        self.flags.sync_log = sync_log.name
+        self.flags.sheet_unchanged = import_summary is None
+
+        if import_summary is None:
+            frappe.msgprint(
+                "No changes in the sheet since the last import.", alert=True, indicator="blue"
+            )
+        elif failed_imports := [x for x in import_summary if x["status"] == "Failed"]:
+            frappe.msgprint(
+                "<br>".join(
+                    f"Worksheet {x['worksheet_id']}: {x['error']}" for x in failed_imports
+                ),
+                title=f"Import failed for {len(failed_imports)} of {len(import_summary)} worksheets",
+                indicator="red",
+            )
+        else:
+            frappe.msgprint("Import Triggered Successfully", indicator="blue", alert=True)
         return self
 
+    def sync_worksheets(self, force: bool = False, max_workers: int | None = None):
+        """Imports the worksheets' changes. Returns the import summary, or None if the sheet is
+        unchanged since the last import."""
+        # sheet handles, metadata & header rows are cached for the duration of a run, the ones
+        # fetched by the write back are reused by the imports as writing the statuses changes
+        # neither the worksheets nor their header rows
+        self.clear_remote_cache()
+        # results of the imports queued by earlier runs, before the modified time the write changes
+        self.write_back_import_statuses()
+        remote_modified_time = self.get_remote_modified_time()
+
+        if not force and remote_modified_time == self.last_modified_time:
+            return None
+
+        for worksheet in self.worksheet_ids:
+            worksheet.advance_counter()
+        self.prefetch_remote_values()
+
+        import_summary = self.trigger_worksheet_imports(max_workers=max_workers)
+        # unchanged sheets are skipped only once all worksheets have been imported
+        if all(x["status"] == "Success" for x in import_summary):
+            # the mappings' state is written by their imports, saving the sheet would overwrite
+            # the fields set outside the sync meanwhile, eg: by `compact_worksheet_imports`
+            self.db_set("last_modified_time", remote_modified_time, update_modified=False)
+
+        return import_summary
+
+    def write_back_import_statuses(self):
+        """Writes the results of the imports finished since the last run to the status columns of
+        the worksheets with `write_back_status`, all in a single values.batchUpdate request. The
+        imports stay pending if it fails, to be written by the next run. The header rows of the
+        worksheets are fetched in one request, & kept for the imports of the run."""
+        worksheets = [x for x in self.worksheet_ids if x.write_back_status]
+        if not worksheets:
+            return
+
+        pending_worksheets = set(
+            frappe.get_all(
+                "Data Import",
+                filters={
+                    "worksheet_id": ("in", [x.name for x in worksheets]),
+                    "write_back_pending": 1,
+                },
+                pluck="worksheet_id",
+                distinct=True,
+            )
+        )
+        worksheets = [x for x in worksheets if x.name in pending_worksheets]
+        self.prefetch_header_rows(worksheets)
+
+        data_imports, value_ranges = [], []
+        for worksheet in worksheets:
+            worksheet_imports, worksheet_ranges = worksheet.get_import_status_ranges()
+            data_imports += worksheet_imports
+            value_ranges += worksheet_ranges
+
+        if value_ranges:
+            remote_spreadsheet = self.get_remote_spreadsheet()
+            try:
+                with stage("write_back"):
+                    remote_spreadsheet.values_batch_update(
+                        {"valueInputOption": "RAW", "data": value_ranges}
+                    )
+            except gs.exceptions.APIError:
+                self.log_error("Writing back import statuses failed")
+                return
+
+        if data_imports:
+            frappe.db.set_value(
+                "Data Import",
+                {"name": ("in", data_imports)},
+                "write_back_pending",
+                0,
+                update_modified=False,
+            )
+
+    def trigger_worksheet_imports(self, max_workers: int | None = None) -> list[dict]:
+        """Prepares the worksheet imports concurrently in a bounded thread pool, then applies them
+        one after another in the current transaction. A failing worksheet doesn't stop the others,
+        results, errors & SyncStats are collected per worksheet."""
+        max_workers = min(
+            max_workers or cint(frappe.conf.sheets_import_workers) or IMPORT_WORKERS,
+            len(self.worksheet_ids),
+        )
+        worksheet_stats = [SyncStats() for _ in self.worksheet_ids]
+        import_summary = []
+
+        executor = (
+            ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else nullcontext()
+        )
+
+        with executor:
+            if max_workers > 1:
+                prepared_imports = [
+                    submit_in_site(executor, prepare_worksheet_import, worksheet, stats)
+                    for worksheet, stats in zip(self.worksheet_ids, worksheet_stats)
+                ]
+            else:
+                prepared_imports = [None] * len(self.worksheet_ids)
+
+            for worksheet, stats, prepared_import in zip(
+                self.worksheet_ids, worksheet_stats, prepared_imports
+            ):
+                summary = {"worksheet_id": worksheet.worksheet_id, "stats": stats}
+                frappe.db.savepoint("worksheet_import")
+                try:
+                    with use_sync_stats(stats):
+                        # renews the sync's lease, a lost lock fails the remaining worksheets
+                        if self.flags.sync_run:
+                            self.flags.sync_run.set_state(IMPORTING)
+                        worksheet_import = (
+                            prepared_import.result()
+                            if prepared_import
+                            else worksheet.prepare_worksheet_import()
+                        )
+                        with stage("import"):
+                            worksheet.apply_worksheet_import(worksheet_import)
+                except Exception as e:
+                    frappe.db.rollback(save_point="worksheet_import")
+                    frappe.clear_last_message()
+                    worksheet.log_error(f"Import failed for Worksheet {worksheet.worksheet_id}")
+                    import_summary.append(
+                        {**summary, "status": "Failed", "error": str(e), "messages": []}
+                    )
+                else:
+                    import_summary.append(
+                        {
+                            **summary,
+                            "status": "Success",
+                            "error": None,
+                            "messages": worksheet_import.messages,
+                        }
+                    )
+
+        return import_summary
 
-@contextmanager
-def patch_importer():
-    from frappe.core.doctype.data_import.importer import Importer
 
-    _official_method = Importer.update_record
-    Importer.update_record = update_record_patch
-    Importer.patched = True
-    yield
-    Importer.update_record = _official_method
-    del Importer.patched
+def prepare_worksheet_import(
+    worksheet: "DocTypeWorksheetMapping", stats: SyncStats
+) -> "WorksheetImport":
+    with use_sync_stats(stats):
+        return worksheet.prepare_worksheet_import()
@@ -1,43 +1,125 @@
 # Copyright (c) 2023, Gavin D'souza and Contributors
 # See license.txt
 
-import os
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 
 import frappe
 from frappe.core.doctype.data_import.importer import Importer
 from frappe.tests.utils import FrappeTestCase
-from frappe.utils import get_site_url
-from requests import get
 
-from sheets.sheets_workspace.doctype.spreadsheet.spreadsheet import patch_importer
+from sheets.benchmarks.sync import (
+    BENCHMARK_DOCTYPE,
+    HEADER,
+    delete_benchmark_doctype,
+    make_benchmark_doctype,
+)
+from sheets.constants import UPDATE
+from sheets.importer import SheetsImporter, start_import
+from sheets.tests.utils import delete_spreadsheet, make_spreadsheet
+from sheets.utils import submit_in_site
 
+SHEET_KEY = "sheets-spreadsheet-test"
 
-def whitelist_for_ci(fn):
-    if os.environ.get("CI"):
-        return frappe.whitelist(allow_guest=True)(fn)
-    return fn
 
-
-@whitelist_for_ci
-def test_api(patch: bool = True):
-    if not patch:
-        return patch, hasattr(Importer, "patched")
-    with patch_importer():
-        time.sleep(10)
-        return patch, hasattr(Importer, "patched")
+def run_import(data_import: str):
+    start_import(data_import)
+    frappe.db.commit()
 
 
 class TestSpreadSheet(FrappeTestCase):
-    def test_importer_monkey_patches(self):
-        # Tested with gunicorn workers = 2, 10 & 17 - lgtm
-        API_PATH = f"{get_site_url(frappe.local.site)}/api/method/{test_api.__module__}.{test_api.__qualname__}"
-        patched, not_patched = {"patch": True}, {"patch": False}
-        ARGS = [patched, not_patched, not_patched] * 3
-
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            futures = [executor.submit(get, API_PATH, params=arg) for arg in ARGS]
-            for future in as_completed(futures):
-                res = future.result().json()["message"]
-                self.assertEqual(res[0], res[1])
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        make_benchmark_doctype()
+
+    @classmethod
+    def tearDownClass(cls):
+        delete_benchmark_doctype()
+        super().tearDownClass()
+
+    def setUp(self):
+        # an Insert mapping, so the imports don't fold their rows into fingerprints
+        self.spreadsheet = make_spreadsheet(
+            SHEET_KEY,
+            [{"worksheet_id": 0, "mapped_doctype": BENCHMARK_DOCTYPE, "import_type": "Insert"}],
+            sheet_name="SpreadSheet Test",
+        )
+
+    def tearDown(self):
+        frappe.db.delete(BENCHMARK_DOCTYPE)
+        delete_spreadsheet(self.spreadsheet)
+
+    def create_update_import(self, rows: list[list[str]], parent_import: str | None = None) -> str:
+        worksheet = self.spreadsheet.worksheet_ids[0]
+        import_file = worksheet.write_import_file([HEADER, *rows])
+        return worksheet.create_data_import(
+            import_file, import_type=UPDATE, parent_import=parent_import
+        ).name
+
+    def run_imports(self, data_imports: list[str]):
+        # the imports run on other connections
+        frappe.db.commit()
+
+        with ThreadPoolExecutor(max_workers=len(data_imports)) as executor:
+            for result in [
+                submit_in_site(executor, run_import, data_import) for data_import in data_imports
+            ]:
+                result.result()
+
+    def test_concurrent_imports(self):
+        for idx in range(1, 5):
+            frappe.get_doc(doctype=BENCHMARK_DOCTYPE, record_id=f"REC-{idx}", title="Old").insert()
+
+        data_imports = {
+            self.create_update_import(
+                [["REC-1", "First", "1"], ["REC-2", "First", "2"], ["REC-5", "First", "5"]]
+            ): ["REC-1", "REC-2", "REC-5"],
+            self.create_update_import(
+                [["REC-3", "Second", "3"], ["REC-4", "Second", "4"], ["REC-6", "Second", "6"]]
+            ): ["REC-3", "REC-4", "REC-6"],
+        }
+        self.run_imports(list(data_imports))
+
+        # each import updated its own records, with its own importer's state
+        for data_import, record_names in data_imports.items():
+            self.assertEqual(frappe.db.get_value("Data Import", data_import, "status"), "Success")
+            logs = frappe.get_all(
+                "Data Import Log",
+                filters={"data_import": data_import},
+                fields=["success", "docname"],
+                order_by="log_index",
+            )
+            self.assertEqual(
+                [(x.success, x.docname) for x in logs], [(1, x) for x in record_names]
+            )
+
+        self.assertEqual(
+            dict(frappe.get_all(BENCHMARK_DOCTYPE, fields=["name", "title"], as_list=True)),
+            {
+                "REC-1": "First",
+                "REC-2": "First",
+                "REC-5": "First",
+                "REC-3": "Second",
+                "REC-4": "Second",
+                "REC-6": "Second",
+            },
+        )
+        # Frappe's Importer isn't patched by the imports
+        self.assertIsNot(Importer.update_record, SheetsImporter.update_record)
+
+    def test_concurrent_shards(self):
+        worksheet = self.spreadsheet.worksheet_ids[0]
+        parent_import = worksheet.create_parent_import()
+        shards = [
+            self.create_update_import([[f"REC-{idx}", "Shard", str(idx)]], parent_import)
+            for idx in range(1, 5)
+        ]
+
+        # the shards finishing together queue on their parent's row
+        self.run_imports(shards)
+
+        self.assertEqual(frappe.db.get_value("Data Import", parent_import, "status"), "Success")
+        self.assertEqual(
+            frappe.db.get_value("DocType Worksheet Mapping", worksheet.name, "last_update_import"),
+            parent_import,
+        )
@@ -3,6 +3,9 @@
 
 from frappe.model.document import Document
 
+from sheets.client import clear_sheet_client_cache
+
 
 class SpreadSheetSettings(Document):
-    ...
+    def on_update(self):
+        clear_sheet_client_cache()
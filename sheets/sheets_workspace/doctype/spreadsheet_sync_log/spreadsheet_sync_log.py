@@ -0,0 +1,72 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder import Interval
+from frappe.query_builder.functions import Now
+
+from sheets.profiling import STAGES, SyncStats
+
+SYNC_LOG_DOCTYPE = "SpreadSheet Sync Log"
+
+
+class SpreadSheetSyncLog(Document):
+    @staticmethod
+    def clear_old_logs(days=30):
+        table = frappe.qb.DocType(SYNC_LOG_DOCTYPE)
+        frappe.db.delete(table, filters=(table.modified < (Now() - Interval(days=days))))
+
+
+def create_sync_log(
+    spreadsheet: str,
+    started_at,
+    duration: float,
+    run_stats: SyncStats,
+    import_summary: list[dict] | None,
+) -> SpreadSheetSyncLog:
+    """Records a sync run. `import_summary` holds the result, messages & SyncStats of every
+    worksheet, it's None for runs skipped as the sheet was unchanged."""
+    totals = SyncStats()
+    totals.merge(run_stats)
+    for worksheet_import in import_summary or []:
+        totals.merge(worksheet_import["stats"])
+
+    if import_summary is None:
+        status = "Skipped"
+    elif any(x["status"] == "Failed" for x in import_summary):
+        status = "Failed"
+    else:
+        status = "Success"
+
+    sync_log = frappe.new_doc(SYNC_LOG_DOCTYPE)
+    sync_log.update(
+        {
+            "spreadsheet": spreadsheet,
+            "status": status,
+            "started_at": started_at,
+            "duration": duration,
+            "api_calls": totals.api_calls,
+            "bytes_fetched": totals.bytes_fetched,
+            "rows_fetched": totals.rows_fetched,
+            "rows_written": totals.rows_written,
+            "worksheet_stats": frappe.as_json(
+                [
+                    {
+                        "worksheet_id": x["worksheet_id"],
+                        "status": x["status"],
+                        "error": x["error"],
+                        # eg: rows rejected by the normalization, not shown by background runs
+                        "messages": x["messages"],
+                        **x["stats"].as_dict(),
+                    }
+                    for x in import_summary or []
+                ]
+            ),
+            "profile": run_stats.profile_report,
+        }
+    )
+    for name in STAGES:
+        sync_log.set(f"{name}_time", totals.stage_times[name])
+
+    return sync_log.insert(ignore_permissions=True)
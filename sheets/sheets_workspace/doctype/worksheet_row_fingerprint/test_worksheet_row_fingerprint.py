@@ -0,0 +1,23 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.sheets_workspace.doctype.worksheet_row_fingerprint.worksheet_row_fingerprint import (
+    clear_row_fingerprints,
+    get_row_fingerprints,
+    set_row_fingerprints,
+)
+
+
+class TestWorksheetRowFingerprint(FrappeTestCase):
+    def test_set_row_fingerprints(self):
+        worksheet_id = "_Test Worksheet Fingerprint"
+
+        set_row_fingerprints(worksheet_id, {"A": "1", "B": "2"}, data_import=None)
+        set_row_fingerprints(worksheet_id, {"B": "20", "C": "3"}, data_import=None)
+
+        self.assertEqual(get_row_fingerprints(worksheet_id), {"A": "1", "B": "20", "C": "3"})
+
+        clear_row_fingerprints(worksheet_id)
+        self.assertEqual(get_row_fingerprints(worksheet_id), {})
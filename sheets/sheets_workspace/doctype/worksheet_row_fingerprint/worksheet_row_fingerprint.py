@@ -0,0 +1,78 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+
+FINGERPRINT_DOCTYPE = "Worksheet Row Fingerprint"
+FINGERPRINT_CHUNK_SIZE = 1_000
+
+
+class WorksheetRowFingerprint(Document):
+    ...
+
+
+def on_doctype_update():
+    frappe.db.add_index(FINGERPRINT_DOCTYPE, ["worksheet_id", "row_key"])
+
+
+def get_row_fingerprints(worksheet_id: str) -> dict[str, str]:
+    """Returns a mapping of row key -> content hash of all rows imported for the worksheet"""
+    return dict(
+        frappe.get_all(
+            FINGERPRINT_DOCTYPE,
+            filters={"worksheet_id": worksheet_id},
+            fields=["row_key", "row_hash"],
+            as_list=True,
+            order_by=None,
+        )
+    )
+
+
+def has_row_fingerprints(worksheet_id: str) -> bool:
+    return bool(frappe.db.exists(FINGERPRINT_DOCTYPE, {"worksheet_id": worksheet_id}))
+
+
+def set_row_fingerprints(worksheet_id: str, fingerprints: dict[str, str], data_import: str):
+    """Upserts the fingerprints of the given rows for the worksheet, replacing existing keys"""
+    row_keys = list(fingerprints)
+    timestamp, user = now(), frappe.session.user
+
+    for idx in range(0, len(row_keys), FINGERPRINT_CHUNK_SIZE):
+        chunk = row_keys[idx : idx + FINGERPRINT_CHUNK_SIZE]
+        frappe.db.delete(
+            FINGERPRINT_DOCTYPE, {"worksheet_id": worksheet_id, "row_key": ("in", chunk)}
+        )
+        frappe.db.bulk_insert(
+            FINGERPRINT_DOCTYPE,
+            fields=[
+                "name",
+                "creation",
+                "modified",
+                "owner",
+                "modified_by",
+                "worksheet_id",
+                "row_key",
+                "row_hash",
+                "data_import",
+            ],
+            values=[
+                (
+                    frappe.generate_hash(length=10),
+                    timestamp,
+                    timestamp,
+                    user,
+                    user,
+                    worksheet_id,
+                    row_key,
+                    fingerprints[row_key],
+                    data_import,
+                )
+                for row_key in chunk
+            ],
+        )
+
+
+def clear_row_fingerprints(worksheet_id: str):
+    frappe.db.delete(FINGERPRINT_DOCTYPE, {"worksheet_id": worksheet_id})
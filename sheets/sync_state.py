@@ -0,0 +1,142 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+"""Sync lock & run state of SpreadSheets, kept in Redis so that they're shared by all workers.
+A sync holds its SpreadSheet's lock for a lease, renewed as the run moves through its states, so
+the lock of a worker that died expires on its own. Triggers finding a SpreadSheet locked are
+merged into a single sync run once the current one has finished."""
+
+import json
+
+import frappe
+from frappe.utils import cint, now
+
+from sheets.constants import SYNC_LEASE, SYNC_STATE_TTL
+
+QUEUED = "Queued"
+FETCHING = "Fetching"
+IMPORTING = "Importing"
+DONE = "Done"
+FAILED = "Failed"
+
+# sets the run state & renews the lease, if the lock is still held with the run's token
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("expire", KEYS[1], ARGV[2])
+    redis.call("set", KEYS[2], ARGV[3], "EX", ARGV[4])
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SyncLockLost(frappe.ValidationError):
+    pass
+
+
+class SyncRun:
+    """A sync of `spreadsheet` holding its lock. The lock is released once the transaction the
+    sync's changes are written in ends, so the next sync reads them."""
+
+    def __init__(self, spreadsheet: str, token: str):
+        self.spreadsheet = spreadsheet
+        self.token = token
+
+    def set_state(self, state: str):
+        """Sets the run's state & renews its lease. Raises SyncLockLost if the lease expired & the
+        lock was taken by another sync meanwhile."""
+        cache = frappe.cache()
+        renewed = cache.eval(
+            RENEW_SCRIPT,
+            2,
+            cache.make_key(get_lock_key(self.spreadsheet)),
+            cache.make_key(get_state_key(self.spreadsheet)),
+            self.token,
+            get_sync_lease(),
+            json.dumps({"state": state, "updated_at": now()}),
+            SYNC_STATE_TTL,
+        )
+        if not renewed:
+            raise SyncLockLost(f"Sync lock of SpreadSheet {self.spreadsheet} was lost")
+
+    def finish(self, state: str):
+        try:
+            self.set_state(state)
+        except SyncLockLost:
+            return
+        frappe.db.after_commit.add(self.release)
+        frappe.db.after_rollback.add(self.release)
+
+    def release(self):
+        """Releases the lock & runs the sync of the triggers merged into this run, if any"""
+        cache = frappe.cache()
+        cache.eval(RELEASE_SCRIPT, 1, cache.make_key(get_lock_key(self.spreadsheet)), self.token)
+        if cache.delete(cache.make_key(get_rerun_key(self.spreadsheet))):
+            from sheets.scheduler import sync_spreadsheet
+
+            frappe.enqueue(sync_spreadsheet, queue="long", spreadsheet=self.spreadsheet)
+
+
+def start_sync_run(spreadsheet: str) -> SyncRun | None:
+    """Takes the sync lock of `spreadsheet`, returns None if another sync holds it"""
+    cache, token = frappe.cache(), frappe.generate_hash(length=16)
+    if not cache.set(
+        cache.make_key(get_lock_key(spreadsheet)), token, nx=True, ex=get_sync_lease()
+    ):
+        return None
+
+    run = SyncRun(spreadsheet, token)
+    run.set_state(FETCHING)
+    return run
+
+
+def request_sync_rerun(spreadsheet: str):
+    """Merges a trigger into the sync holding the lock, the sheet is synced once more after it.
+    Any number of triggers during a run result in a single sync."""
+    cache = frappe.cache()
+    cache.set(cache.make_key(get_rerun_key(spreadsheet)), 1, ex=get_sync_lease())
+
+
+def is_sync_running(spreadsheet: str) -> bool:
+    cache = frappe.cache()
+    # RedisWrapper.exists scopes keys by user
+    return cache.get(cache.make_key(get_lock_key(spreadsheet))) is not None
+
+
+def set_queued(spreadsheet: str):
+    cache = frappe.cache()
+    cache.set(
+        cache.make_key(get_state_key(spreadsheet)),
+        json.dumps({"state": QUEUED, "updated_at": now()}),
+        ex=SYNC_STATE_TTL,
+    )
+
+
+def get_sync_state(spreadsheet: str) -> dict | None:
+    cache = frappe.cache()
+    if state := cache.get(cache.make_key(get_state_key(spreadsheet))):
+        return json.loads(state)
+    return None
+
+
+def get_sync_lease() -> int:
+    return cint(frappe.conf.sheets_sync_lease) or SYNC_LEASE
+
+
+def get_lock_key(spreadsheet: str) -> str:
+    return f"sheets:sync_lock:{spreadsheet}"
+
+
+def get_state_key(spreadsheet: str) -> str:
+    return f"sheets:sync_state:{spreadsheet}"
+
+
+def get_rerun_key(spreadsheet: str) -> str:
+    return f"sheets:sync_rerun:{spreadsheet}"
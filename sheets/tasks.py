@@ -0,0 +1,30 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import add_days, cint, now_datetime
+
+from sheets.constants import SNAPSHOT_RETENTION_DAYS
+
+
+def compact_worksheet_imports():
+    """Compacts the import files of every worksheet older than the retention period, set by the
+    `sheets_snapshot_retention_days` site config, into the worksheet's baseline file"""
+    retention_days = cint(frappe.conf.sheets_snapshot_retention_days) or SNAPSHOT_RETENTION_DAYS
+    before = add_days(now_datetime(), -retention_days)
+
+    # only Upsert imports are replayed from the import files, see `compact_imports`
+    for spreadsheet in frappe.get_all(
+        "DocType Worksheet Mapping",
+        filters={"import_type": "Upsert"},
+        pluck="parent",
+        distinct=True,
+    ):
+        # the mappings are loaded through their SpreadSheet, which they access as `parent_doc`
+        for worksheet in frappe.get_doc("SpreadSheet", spreadsheet).worksheet_ids:
+            try:
+                worksheet.compact_imports(before=before)
+                frappe.db.commit()
+            except Exception:
+                frappe.db.rollback()
+                worksheet.log_error("Worksheet import compaction failed")
@@ -0,0 +1,69 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+from operator import itemgetter
+
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.benchmarks import reconstruction
+from sheets.diff import diff_rows, fingerprint_rows, get_row_shard, replay_imports
+
+
+class TestRowDiff(FrappeTestCase):
+    def test_diff_rows(self):
+        imported = [["A", "1"], ["B", "2"], ["C", "3"]]
+        remote = [["C", "3"], ["B", "20"], ["A", "1"], ["D", "4"], ["", ""]]
+
+        row_diff = diff_rows(fingerprint_rows(imported, 0), remote, 0)
+
+        self.assertEqual(row_diff.inserted, [["D", "4"]])
+        self.assertEqual(row_diff.changed, [["B", "20"]])
+        self.assertEqual(row_diff.unchanged, 2)
+
+    def test_diff_numbered_rows(self):
+        imported = [["A", "1"], ["B", "2"]]
+        remote = [(2, ["A", "1"]), (3, ["B", "20"]), (4, ["C", "3"]), (5, ["", ""])]
+
+        row_diff = diff_rows(fingerprint_rows(imported, 0), remote, 0, get_row=itemgetter(1))
+
+        # rows are reported along with their row numbers
+        self.assertEqual(row_diff.inserted, [(4, ["C", "3"])])
+        self.assertEqual(row_diff.changed, [(3, ["B", "20"])])
+        self.assertEqual(row_diff.unchanged, 1)
+
+    def test_get_row_shard(self):
+        rows = [[f"REC-{idx}", "x"] for idx in range(100)]
+        shards = [get_row_shard(row, 0, 4) for row in rows]
+
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+        # rows of a key share a shard whatever their content
+        self.assertEqual([get_row_shard([x[0], "y"], 0, 4) for x in rows], shards)
+
+    def test_diff_rows_ignores_trailing_empty_cells(self):
+        row_diff = diff_rows(fingerprint_rows([["A", "1"]], 0), [["A", "1", "", ""]], 0)
+        self.assertEqual(row_diff.unchanged, 1)
+
+    def test_diff_rows_without_id(self):
+        imported = [["", "x"], ["", "y"]]
+        remote = [["", "x"], ["", "z"]]
+
+        row_diff = diff_rows(fingerprint_rows(imported, 0), remote, 0)
+
+        self.assertEqual(row_diff.unchanged, 1)
+        self.assertEqual(row_diff.inserted, [["", "z"]])
+
+
+class TestReplayImports(FrappeTestCase):
+    def test_replay_imports(self):
+        insert_csvs = ["ID,Qty\r\nA,1\r\nB,2\r\n", "ID,Qty\r\nC,3\r\n"]
+        update_csvs = ["ID,Qty\r\nB,20\r\n", "Qty,ID\r\n30,C\r\n10,A\r\n"]
+
+        self.assertEqual(
+            replay_imports(insert_csvs, update_csvs, "ID"),
+            [["ID", "Qty"], ["10", "A"], ["B", "20"], ["30", "C"]],
+        )
+
+    def test_replay_imports_matches_nested_loop(self):
+        # timings vary by machine, only the reconstructed rows are compared
+        for result in reconstruction.run(sizes=(500, 2_000)):
+            self.assertTrue(result["matches"])
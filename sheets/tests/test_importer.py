@@ -0,0 +1,161 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.benchmarks.sync import (
+    BENCHMARK_DOCTYPE,
+    HEADER,
+    delete_benchmark_doctype,
+    make_benchmark_doctype,
+)
+from sheets.constants import UPDATE
+from sheets.importer import get_bulk_import_issues, start_import
+from sheets.tests.utils import delete_spreadsheet, make_spreadsheet
+
+SHEET_KEY = "sheets-importer-test"
+
+
+class TestImporter(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # a custom DocType, without controller methods & keyed by the unique "Record ID"
+        make_benchmark_doctype()
+
+    @classmethod
+    def tearDownClass(cls):
+        delete_benchmark_doctype()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.spreadsheet = make_spreadsheet(
+            SHEET_KEY,
+            [{"worksheet_id": 0, "mapped_doctype": BENCHMARK_DOCTYPE, "import_type": "Upsert"}],
+            sheet_name="Importer Test",
+        )
+        self.worksheet = self.spreadsheet.worksheet_ids[0]
+
+    def tearDown(self):
+        frappe.db.delete(BENCHMARK_DOCTYPE)
+        delete_spreadsheet(self.spreadsheet)
+
+    def import_rows(self, rows: list[list[str]], **kwargs):
+        import_file = self.worksheet.write_import_file([HEADER, *rows])
+        data_import = self.worksheet.create_data_import(import_file, **kwargs)
+        start_import(data_import.name)
+        return frappe.get_doc("Data Import", data_import.name)
+
+    def test_update_repeated_key(self):
+        data_import = self.import_rows(
+            [["REC-1", "First", "1"], ["REC-2", "Second", "2"], ["REC-1", "Repeated", "3"]],
+            import_type=UPDATE,
+        )
+
+        self.assertEqual(data_import.status, "Success")
+        self.assertEqual(frappe.db.count(BENCHMARK_DOCTYPE), 2)
+        # the repeated key updates the record inserted by the first row
+        self.assertEqual(
+            frappe.db.get_value(BENCHMARK_DOCTYPE, "REC-1", ["title", "qty"]), ("Repeated", 3)
+        )
+
+    def test_update_key_differing_in_case(self):
+        if frappe.db.db_type != "mariadb":
+            self.skipTest("Only MariaDB matches keys ignoring case & trailing spaces")
+
+        frappe.get_doc(doctype=BENCHMARK_DOCTYPE, record_id="REC-1", title="Old").insert()
+        data_import = self.import_rows([["rec-1 ", "Updated", "1"]], import_type=UPDATE)
+
+        # the record matched by the database is updated, instead of inserting a duplicate
+        self.assertEqual(data_import.status, "Success")
+        self.assertEqual(frappe.db.count(BENCHMARK_DOCTYPE), 1)
+        self.assertEqual(frappe.db.get_value(BENCHMARK_DOCTYPE, "REC-1", "title"), "Updated")
+
+    def get_import_logs(self, data_import: str) -> list[dict]:
+        return frappe.get_all(
+            "Data Import Log",
+            filters={"data_import": data_import},
+            fields=["success", "docname", "row_indexes", "log_index"],
+            order_by="log_index",
+        )
+
+    def test_bulk_import(self):
+        self.worksheet.db_set({"import_type": "Insert", "bulk_import": 1})
+        data_import = self.import_rows([["REC-1", "First", "1"], ["REC-2", "Second", "2"]])
+
+        self.assertEqual(data_import.status, "Success")
+        self.assertEqual(frappe.db.get_value(BENCHMARK_DOCTYPE, "REC-2", "qty"), 2)
+        self.assertEqual(
+            [(x.success, x.docname) for x in self.get_import_logs(data_import.name)],
+            [(1, "REC-1"), (1, "REC-2")],
+        )
+
+    def test_bulk_import_duplicate_name(self):
+        self.worksheet.db_set({"import_type": "Insert", "bulk_import": 1})
+        data_import = self.import_rows(
+            [["REC-1", "First", "1"], ["REC-2", "Second", "2"], ["REC-1", "Repeated", "3"]]
+        )
+
+        # the chunk's multi-row INSERT fails, its rows are inserted one by one instead
+        self.assertEqual(data_import.status, "Partial Success")
+        self.assertEqual(frappe.db.count(BENCHMARK_DOCTYPE), 2)
+        self.assertEqual(frappe.db.get_value(BENCHMARK_DOCTYPE, "REC-1", "title"), "First")
+        self.assertEqual(
+            [
+                (x.success, json.loads(x.row_indexes))
+                for x in self.get_import_logs(data_import.name)
+            ],
+            [(1, [2]), (1, [3]), (0, [4])],
+        )
+
+    def test_bulk_import_retry(self):
+        self.worksheet.db_set({"import_type": "Insert", "bulk_import": 1})
+        frappe.get_doc(doctype=BENCHMARK_DOCTYPE, record_id="REC-2", title="Existing").insert()
+        data_import = self.import_rows([["REC-1", "First", "1"], ["REC-2", "Second", "2"]])
+        self.assertEqual(data_import.status, "Partial Success")
+
+        frappe.delete_doc(BENCHMARK_DOCTYPE, "REC-2")
+        start_import(data_import.name)
+        data_import.reload()
+
+        # only the failed row is imported again, its failure log is replaced by the next log
+        self.assertEqual(data_import.status, "Success")
+        self.assertEqual(frappe.db.get_value(BENCHMARK_DOCTYPE, "REC-2", "title"), "Second")
+        self.assertEqual(
+            [(x.success, x.docname, x.log_index) for x in self.get_import_logs(data_import.name)],
+            [(1, "REC-1", 0), (1, "REC-2", 2)],
+        )
+
+    def test_bulk_import_issues(self):
+        get_hooks = frappe.get_hooks
+        doc_events = {"*": {"after_insert": ["app.hooks.after_insert"]}}
+
+        with patch(
+            "frappe.get_hooks",
+            side_effect=lambda hook=None, *args, **kwargs: (
+                doc_events if hook == "doc_events" else get_hooks(hook, *args, **kwargs)
+            ),
+        ):
+            self.assertIn(
+                "doc_events hooks are set for all DocTypes",
+                get_bulk_import_issues(BENCHMARK_DOCTYPE),
+            )
+
+    def test_after_worksheet_import_failure(self):
+        self.worksheet.db_set("write_back_status", 1)
+        with patch("sheets.importer.after_worksheet_import", side_effect=frappe.ValidationError):
+            data_import = self.import_rows([["REC-1", "First", "1"]], import_type=UPDATE)
+
+        # the import's results are still queued to be written back
+        self.assertEqual(data_import.status, "Success")
+        self.assertTrue(data_import.write_back_pending)
+        self.assertTrue(
+            frappe.get_all(
+                "Error Log",
+                filters={"reference_name": data_import.name, "method": ("like", "Updating%")},
+            )
+        )
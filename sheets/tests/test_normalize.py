@@ -0,0 +1,58 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.normalize import (
+    DATE_FORMATS,
+    DateNormalizer,
+    NumberNormalizer,
+    RowNormalizer,
+    normalize_check,
+)
+
+
+class TestNormalize(FrappeTestCase):
+    def test_normalizers(self):
+        values, errors = NumberNormalizer()(["$ 1,234.50", "(12)", "15%", "", "12abc"])
+        self.assertEqual(values[:4], ["1234.5", "-12.0", "15.0", ""])
+        self.assertEqual(list(errors), [4])
+
+        values, errors = NumberNormalizer(whole_numbers=True)(["1,000", "2.5"])
+        self.assertEqual(values[0], "1000")
+        self.assertEqual(list(errors), [1])
+
+        self.assertEqual(normalize_check(["TRUE", "false", " ", "maybe"])[0][:3], ["1", "0", ""])
+
+        # values in another format than the column's first value are parsed on their own
+        values, errors = DateNormalizer(DATE_FORMATS, "%Y-%m-%d")(
+            ["2023-05-13", "14 May 2023", "2023-05-15", "not a date"]
+        )
+        self.assertEqual(values[:3], ["2023-05-13", "2023-05-14", "2023-05-15"])
+        self.assertEqual(list(errors), [3])
+
+    def test_row_normalizer(self):
+        normalizer = RowNormalizer("ToDo", ["Status", "Due Date", "Comment"])
+        rows = normalizer.normalize(
+            zip(
+                range(2, 6),
+                [
+                    [" Open ", "2023-05-13", " note "],
+                    ["Open", "2023-05-14"],
+                    ["Unknown", "2023-05-15", ""],
+                    ["Closed", "not a date", ""],
+                ],
+            )
+        )
+
+        self.assertEqual(
+            list(rows),
+            [
+                (2, ["Open", "2023-05-13", "note"]),
+                (3, ["Open", "2023-05-14", ""]),
+                (4, ["", "", ""]),
+                (5, ["", "", ""]),
+            ],
+        )
+        self.assertEqual([x.row_number for x in normalizer.rejected_rows], [4, 5])
+        self.assertIn("Skipped 2 rows", normalizer.get_messages()[0])
@@ -0,0 +1,26 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+from time import sleep
+
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.profiling import SyncStats, record_rows, stage, use_sync_stats
+
+
+class TestSyncStats(FrappeTestCase):
+    def test_nested_stages(self):
+        stats = SyncStats()
+
+        with use_sync_stats(stats), stage("write"):
+            with stage("fetch"):
+                sleep(0.05)
+            record_rows(fetched=10, written=10)
+
+        self.assertGreaterEqual(stats.stage_times["fetch"], 0.05)
+        self.assertLess(stats.stage_times["write"], 0.05)
+        self.assertEqual((stats.rows_fetched, stats.rows_written), (10, 10))
+
+    def test_stats_outside_sync(self):
+        with stage("fetch"):
+            record_rows(fetched=10)
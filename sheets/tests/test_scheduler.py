@@ -0,0 +1,30 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+from datetime import datetime, timedelta
+
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.constants import MAX_POLL_BACKOFF, SYNC_JITTER
+from sheets.scheduler import get_next_sync_time
+
+
+class TestScheduler(FrappeTestCase):
+    def test_get_next_sync_time(self):
+        after = datetime(2023, 5, 1, 10, 2)
+
+        def get_delay(cron, backoff=0):
+            return get_next_sync_time(cron, after, backoff) - after
+
+        # the next occurrence, jittered by up to half the interval
+        self.assertTrue(timedelta(minutes=3) <= get_delay("*/5 * * * *") <= timedelta(minutes=5.5))
+        # unchanged sheets skip occurrences, up to MAX_POLL_BACKOFF doublings
+        self.assertGreaterEqual(get_delay("*/5 * * * *", backoff=2), timedelta(minutes=18))
+        self.assertLess(
+            get_delay("*/5 * * * *", backoff=MAX_POLL_BACKOFF + 5),
+            timedelta(minutes=5 * 2**MAX_POLL_BACKOFF),
+        )
+        # polls of hourly & less frequent sheets aren't delayed
+        self.assertLess(
+            get_delay("0 * * * *", backoff=3), timedelta(minutes=58, seconds=SYNC_JITTER)
+        )
@@ -0,0 +1,25 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.benchmarks import sync
+
+
+class TestSyncBenchmark(FrappeTestCase):
+    def tearDown(self):
+        sync.delete_benchmark_doctype()
+
+    def test_sync_benchmark(self):
+        results = {x["run"]: x for x in sync.run(sizes=(200,), churn=0.05, measure_memory=False)}
+
+        self.assertEqual(results["insert"]["rows"], 200)
+        self.assertEqual(results["append"]["rows"], 10)
+        self.assertEqual(results["upsert"]["rows"], 10)
+
+        # sheet modified time, spreadsheet & worksheet metadata and a single values.batchGet
+        for result in results.values():
+            self.assertEqual(result["api_calls"], 4)
+
+        self.assertFalse(frappe.db.count(sync.BENCHMARK_DOCTYPE))
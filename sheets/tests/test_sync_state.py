@@ -0,0 +1,57 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.sync_state import (
+    DONE,
+    FAILED,
+    IMPORTING,
+    SyncLockLost,
+    get_lock_key,
+    get_sync_state,
+    is_sync_running,
+    request_sync_rerun,
+    start_sync_run,
+)
+
+SPREADSHEET = "sheets-sync-state-test"
+
+
+class TestSyncState(FrappeTestCase):
+    def tearDown(self):
+        cache = frappe.cache()
+        cache.delete(cache.make_key(get_lock_key(SPREADSHEET)))
+
+    @patch("frappe.enqueue")
+    def test_sync_lock(self, enqueue):
+        sync_run = start_sync_run(SPREADSHEET)
+        self.assertTrue(is_sync_running(SPREADSHEET))
+        self.assertIsNone(start_sync_run(SPREADSHEET))
+
+        sync_run.set_state(IMPORTING)
+        self.assertEqual(get_sync_state(SPREADSHEET)["state"], IMPORTING)
+
+        # overlapping triggers are merged into a single sync after the run
+        request_sync_rerun(SPREADSHEET)
+        request_sync_rerun(SPREADSHEET)
+        sync_run.finish(DONE)
+        sync_run.release()
+        self.assertFalse(is_sync_running(SPREADSHEET))
+        self.assertEqual(get_sync_state(SPREADSHEET)["state"], DONE)
+        self.assertEqual(enqueue.call_count, 1)
+        self.assertEqual(enqueue.call_args.kwargs["spreadsheet"], SPREADSHEET)
+
+    def test_lost_lock(self):
+        sync_run = start_sync_run(SPREADSHEET)
+        # the lease expired & another sync took the lock
+        cache = frappe.cache()
+        cache.set(cache.make_key(get_lock_key(SPREADSHEET)), "another-sync")
+
+        self.assertRaises(SyncLockLost, sync_run.set_state, IMPORTING)
+        sync_run.finish(FAILED)
+        sync_run.release()
+        self.assertTrue(is_sync_running(SPREADSHEET))
@@ -0,0 +1,39 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import os
+from tempfile import TemporaryDirectory
+
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.utils import read_csv_file, write_csv_chunks, write_csv_file
+
+
+class TestWriteCSVChunks(FrappeTestCase):
+    def test_write_csv_chunks(self):
+        rows = [[str(x), f"row {x}"] for x in range(5)]
+
+        with TemporaryDirectory() as tmp_dir:
+            paths = iter(os.path.join(tmp_dir, f"{x}.csv") for x in range(10))
+            csv_files = write_csv_chunks(lambda: next(paths), ["ID", "Title"], rows, 2)
+
+            self.assertEqual([x.row_count for x in csv_files], [3, 3, 2])
+            with open(csv_files[-1].path, newline="") as f:
+                self.assertEqual(f.read(), "ID,Title\r\n4,row 4\r\n")
+
+        self.assertEqual(write_csv_chunks(lambda: "", ["ID"], [], 2), [])
+
+
+class TestWriteCSVFile(FrappeTestCase):
+    def test_compressed_csv_file(self):
+        rows = [["ID", "Title"], *([str(x), "row"] for x in range(100))]
+
+        with TemporaryDirectory() as tmp_dir:
+            csv_file = write_csv_file(os.path.join(tmp_dir, "plain.csv"), rows)
+            compressed_file = write_csv_file(
+                os.path.join(tmp_dir, "compressed.csv.gz"), rows, compress=True
+            )
+
+            self.assertEqual(compressed_file.content_hash, csv_file.content_hash)
+            self.assertLess(compressed_file.file_size, csv_file.file_size)
+            self.assertEqual(read_csv_file(compressed_file.path), read_csv_file(csv_file.path))
@@ -0,0 +1,109 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.test_api import FrappeAPITestCase
+
+from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
+    DocTypeWorksheetMapping,
+)
+from sheets.sync_state import DONE, get_state_key, get_sync_state, is_sync_running
+from sheets.tests.utils import delete_spreadsheet, make_spreadsheet
+from sheets.webhook import (
+    WEBHOOK_SECRET_HEADER,
+    claim_notified_rows,
+    get_claim_key,
+    get_notified_rows_key,
+    import_notified_rows,
+    pop_notified_rows,
+    queue_notified_rows,
+    release_notified_rows,
+)
+
+SHEET_KEY = "sheets-webhook-test"
+WEBHOOK_PATH = "/api/method/sheets.api.notify_changes"
+
+
+class TestWebhook(FrappeAPITestCase):
+    def setUp(self):
+        self.spreadsheet = make_spreadsheet(
+            SHEET_KEY,
+            [{"worksheet_id": 0, "mapped_doctype": "ToDo", "import_type": "Upsert"}],
+            webhook_secret="webhook-secret",
+        )
+        self.worksheet = self.spreadsheet.worksheet_ids[0].name
+        # the requests are served by another connection
+        frappe.db.commit()
+
+    def tearDown(self):
+        cache = frappe.cache()
+        cache.delete_value(get_notified_rows_key(self.worksheet))
+        cache.delete(cache.make_key(get_claim_key(self.worksheet)))
+        cache.delete(cache.make_key(get_state_key(self.spreadsheet.name)))
+        delete_spreadsheet(self.spreadsheet)
+
+    def notify(self, rows, secret="webhook-secret"):
+        return self.post(
+            WEBHOOK_PATH,
+            None,
+            json={"spreadsheet_id": SHEET_KEY, "worksheet_id": 0, "rows": rows},
+            headers={WEBHOOK_SECRET_HEADER: secret},
+        )
+
+    @patch("frappe.enqueue")
+    def test_notify_changes(self, enqueue):
+        self.assertEqual(self.notify([3, 2], secret="wrong-secret").status_code, 403)
+        enqueue.assert_not_called()
+
+        response = self.notify([3, 2, 1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["message"], {"queued": 2})
+        self.notify([2, 7])
+
+        # a single job imports the notified rows
+        self.assertEqual(enqueue.call_count, 1)
+        self.assertEqual(enqueue.call_args.kwargs["worksheet"], self.worksheet)
+        # notifications are batched till the queued job imports them
+        self.assertEqual(pop_notified_rows(self.worksheet), [2, 3, 7])
+        self.assertEqual(pop_notified_rows(self.worksheet), [])
+
+    @patch("frappe.enqueue")
+    @patch("sheets.webhook.wait_for_notifications")
+    @patch.object(DocTypeWorksheetMapping, "import_notified_rows", autospec=True)
+    def test_import_notified_rows(self, import_rows, wait_for_notifications, enqueue):
+        import_rows.return_value = ["Skipped 1 rows with invalid values"]
+        queue_notified_rows(self.worksheet, [3, 2])
+        import_notified_rows(self.worksheet)
+
+        worksheet_doc, row_numbers = import_rows.call_args.args
+        # loaded through its SpreadSheet, which the import accesses as `parent_doc`
+        self.assertEqual(worksheet_doc.parent_doc.name, self.spreadsheet.name)
+        self.assertEqual(row_numbers, [2, 3])
+        self.assertEqual(get_sync_state(self.spreadsheet.name)["state"], DONE)
+        self.assertFalse(is_sync_running(self.spreadsheet.name))
+        # the messages of the imports are recorded, as nobody sees them otherwise
+        sync_log = frappe.get_last_doc(
+            "SpreadSheet Sync Log", {"spreadsheet": self.spreadsheet.name}
+        )
+        self.assertEqual(
+            json.loads(sync_log.worksheet_stats)[0]["messages"], import_rows.return_value
+        )
+
+        # the job released its claim, the next notification queues another job
+        queue_notified_rows(self.worksheet, [4])
+        self.assertEqual(enqueue.call_count, 2)
+
+    def test_release_notified_rows(self):
+        self.assertTrue(claim_notified_rows(self.worksheet))
+        self.assertFalse(claim_notified_rows(self.worksheet))
+
+        # rows notified after the job found none left, while it still held its claim
+        frappe.cache().sadd(get_notified_rows_key(self.worksheet), 5)
+        self.assertFalse(release_notified_rows(self.worksheet))
+        self.assertEqual(pop_notified_rows(self.worksheet), [5])
+
+        self.assertTrue(release_notified_rows(self.worksheet))
+        self.assertTrue(claim_notified_rows(self.worksheet))
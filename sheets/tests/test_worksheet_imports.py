@@ -0,0 +1,197 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, now_datetime
+
+from sheets.constants import INSERT, SNAPSHOT_RETENTION_DAYS, UPDATE
+from sheets.importer import finish_shard, start_import
+from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
+    WorksheetImport,
+)
+from sheets.sheets_workspace.doctype.worksheet_row_fingerprint.worksheet_row_fingerprint import (
+    get_row_fingerprints,
+)
+from sheets.tasks import compact_worksheet_imports
+from sheets.tests.utils import delete_spreadsheet, make_spreadsheet
+
+SHEET_KEY = "sheets-worksheet-imports-test"
+
+
+class TestWorksheetImports(FrappeTestCase):
+    def setUp(self):
+        self.spreadsheet = make_spreadsheet(
+            SHEET_KEY,
+            [{"worksheet_id": 0, "mapped_doctype": "ToDo", "import_type": "Insert"}],
+            sheet_name="Worksheet Imports Test",
+        )
+        self.worksheet = self.spreadsheet.worksheet_ids[0]
+
+    def tearDown(self):
+        frappe.db.delete("ToDo", {"description": ("like", "_Test Sheets%")})
+        delete_spreadsheet(self.spreadsheet)
+
+    def import_rows(self, rows: list[list[str]], row_start: int):
+        import_file = self.worksheet.write_import_file(rows)
+        data_import = self.worksheet.create_data_import(import_file, row_start=row_start)
+        start_import(data_import.name)
+        return frappe.get_doc("Data Import", data_import.name)
+
+    def test_insert_without_id_column(self):
+        data_import = self.import_rows(
+            [["Description"], ["_Test Sheets Insert 1"], ["_Test Sheets Insert 2"]], row_start=2
+        )
+
+        self.assertEqual(data_import.status, "Success")
+        self.assertTrue(frappe.db.exists("ToDo", {"description": "_Test Sheets Insert 2"}))
+        # the counter is advanced, even though the rows can't be fingerprinted
+        self.assertEqual(
+            frappe.db.get_value("DocType Worksheet Mapping", self.worksheet.name, "counter"), 3
+        )
+        self.assertFalse(data_import.row_fingerprints_updated)
+
+    def test_apply_rebuilt_fingerprints(self):
+        # prepared in a worker thread, the rebuilt fingerprints are stored on the main connection
+        self.worksheet.apply_worksheet_import(
+            WorksheetImport(INSERT, [], [], rebuilt_fingerprints=({"A": "1", "B": "2"}, None))
+        )
+        self.assertEqual(get_row_fingerprints(self.worksheet.name), {"A": "1", "B": "2"})
+
+        # fingerprints folded in meanwhile aren't replaced by the stale ones
+        self.worksheet.apply_worksheet_import(
+            WorksheetImport(INSERT, [], [], rebuilt_fingerprints=({"A": "10"}, None))
+        )
+        self.assertEqual(get_row_fingerprints(self.worksheet.name), {"A": "1", "B": "2"})
+
+    def test_apply_keeps_fields_set_meanwhile(self):
+        # eg: compacted while the import was prepared from a copy loaded before
+        frappe.db.set_value(
+            "DocType Worksheet Mapping", self.worksheet.name, "baseline_file", "/private/files/x"
+        )
+        self.worksheet.apply_worksheet_import(WorksheetImport(UPDATE, [], []))
+        self.assertEqual(self.get_worksheet_value("baseline_file"), "/private/files/x")
+
+    def make_chunk(self, row_start: int, status: str, row_count: int = 10) -> str:
+        data_import = self.worksheet.new_data_import()
+        data_import.update(
+            {
+                "spreadsheet_id": self.spreadsheet.name,
+                "worksheet_id": self.worksheet.name,
+                "worksheet_row_start": row_start,
+                "worksheet_row_count": row_count,
+            }
+        )
+        data_import.save()
+        data_import.db_set("status", status)
+        return data_import.name
+
+    def get_counter(self) -> int:
+        self.worksheet.advance_counter()
+        return frappe.db.get_value("DocType Worksheet Mapping", self.worksheet.name, "counter")
+
+    def test_advance_counter_out_of_order(self):
+        first, second = self.make_chunk(2, "Pending"), self.make_chunk(12, "Pending")
+        self.make_chunk(22, "Success")
+        # the rows before the last chunk aren't imported yet
+        self.assertEqual(self.get_counter(), 0)
+
+        frappe.db.set_value("Data Import", second, "status", "Success")
+        self.assertEqual(self.get_counter(), 0)
+
+        frappe.db.set_value("Data Import", first, "status", "Partial Success")
+        self.assertEqual(self.get_counter(), 31)
+
+    def test_advance_counter_failed_chunk(self):
+        self.make_chunk(2, "Success")
+        failed = self.make_chunk(12, "Error")
+        last = self.make_chunk(22, "Success")
+        # the failed chunk blocks the counter till it's retried
+        self.assertEqual(self.get_counter(), 11)
+        self.assertEqual(
+            [x.name for x in self.worksheet.get_outstanding_imports()], [failed, last]
+        )
+
+        frappe.db.set_value("Data Import", failed, "status", "Success")
+        self.assertEqual(self.get_counter(), 31)
+        self.assertEqual(self.worksheet.get_outstanding_imports(), [])
+
+    def make_shards(self, count: int) -> tuple[str, list]:
+        parent_import = self.worksheet.create_parent_import()
+        shards = []
+        for _ in range(count):
+            shard = self.worksheet.new_data_import(import_type=UPDATE)
+            shard.update(
+                {
+                    "spreadsheet_id": self.spreadsheet.name,
+                    "worksheet_id": self.worksheet.name,
+                    "parent_import": parent_import,
+                }
+            )
+            shards.append(shard.save())
+        return parent_import, shards
+
+    def finish_shard(self, shard, status: str):
+        shard.db_set("status", status)
+        finish_shard(shard)
+        return frappe.db.get_value(
+            "DocType Worksheet Mapping", self.worksheet.name, "last_update_import"
+        )
+
+    def test_finish_shards(self):
+        parent_import, shards = self.make_shards(2)
+
+        # the parent is only set as the last update once all the shards succeeded
+        self.assertFalse(self.finish_shard(shards[0], "Success"))
+        self.assertEqual(frappe.db.get_value("Data Import", parent_import, "status"), "Pending")
+
+        self.assertEqual(self.finish_shard(shards[1], "Partial Success"), parent_import)
+        self.assertEqual(
+            frappe.db.get_value("Data Import", parent_import, "status"), "Partial Success"
+        )
+
+    def test_finish_failed_shard(self):
+        parent_import, shards = self.make_shards(2)
+
+        self.assertFalse(self.finish_shard(shards[0], "Error"))
+        self.assertFalse(self.finish_shard(shards[1], "Success"))
+        self.assertEqual(
+            frappe.db.get_value("Data Import", parent_import, "status"), "Partial Success"
+        )
+
+        # the failed shard succeeding once retried completes the update
+        self.assertEqual(self.finish_shard(shards[0], "Success"), parent_import)
+        self.assertEqual(frappe.db.get_value("Data Import", parent_import, "status"), "Success")
+
+    def test_compact_worksheet_imports(self):
+        for import_type, rows in (
+            (INSERT, [["ID", "Description"], ["TODO-1", "First"], ["TODO-2", "Second"]]),
+            (UPDATE, [["ID", "Description"], ["TODO-1", "Updated"]]),
+        ):
+            import_file = self.worksheet.write_import_file(rows)
+            data_import = self.worksheet.create_data_import(import_file, import_type=import_type)
+            data_import.db_set(
+                {
+                    "status": "Success",
+                    "creation": add_days(now_datetime(), -SNAPSHOT_RETENTION_DAYS - 1),
+                },
+                update_modified=False,
+            )
+
+        # Insert mappings aren't compacted
+        compact_worksheet_imports()
+        self.assertFalse(self.get_worksheet_value("baseline_file"))
+
+        self.worksheet.db_set("import_type", "Upsert")
+        compact_worksheet_imports()
+        self.assertTrue(self.get_worksheet_value("baseline_file"))
+        self.assertEqual(set(get_row_fingerprints(self.worksheet.name)), {"TODO-1", "TODO-2"})
+        self.assertFalse(
+            frappe.get_all(
+                "Data Import",
+                filters={"worksheet_id": self.worksheet.name, "import_file": ("is", "set")},
+            )
+        )
+
+    def get_worksheet_value(self, fieldname: str):
+        return frappe.db.get_value("DocType Worksheet Mapping", self.worksheet.name, fieldname)
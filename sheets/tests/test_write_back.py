@@ -0,0 +1,55 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
+    get_import_statuses,
+)
+
+
+def make_log(success: int, row_indexes: list[int], docname=None, messages=None, exception=None):
+    return frappe._dict(
+        success=success,
+        docname=docname,
+        row_indexes=json.dumps(row_indexes),
+        messages=json.dumps(messages or []),
+        exception=exception,
+    )
+
+
+class TestWriteBack(FrappeTestCase):
+    def test_import_statuses(self):
+        logs = [
+            make_log(1, [2], docname="TODO-0001"),
+            make_log(0, [3], messages=[json.dumps({"message": "<b>Status</b> is invalid"})]),
+            make_log(0, [4], exception="Traceback\nValidationError: Value missing"),
+        ]
+        chunk = frappe._dict(
+            name="DI-1", status="Partial Success", worksheet_row_start=10, worksheet_row_count=3
+        )
+        with patch("frappe.get_all", return_value=logs):
+            self.assertEqual(
+                get_import_statuses(chunk),
+                {
+                    10: "Imported TODO-0001",
+                    11: "Failed: Status is invalid",
+                    12: "Failed: ValidationError: Value missing",
+                },
+            )
+
+            # update imports map the rows of their file to the worksheet rows recorded
+            update = frappe._dict(name="DI-2", status="Success", worksheet_row_numbers="[7, 3, 5]")
+            self.assertEqual(list(get_import_statuses(update)), [7, 3, 5])
+
+        failed_chunk = frappe._dict(chunk, status="Error")
+        with patch("frappe.get_all", return_value=[]):
+            self.assertEqual(
+                get_import_statuses(failed_chunk),
+                dict.fromkeys([10, 11, 12], "Failed: DI-1 failed"),
+            )
+            self.assertEqual(get_import_statuses(frappe._dict(name="DI-3", status="Success")), {})
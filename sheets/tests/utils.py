@@ -0,0 +1,44 @@
+# Copyright (c) 2023, Gavin D'souza and Contributors
+# See license.txt
+
+import frappe
+
+from sheets.sheets_workspace.doctype.worksheet_row_fingerprint.worksheet_row_fingerprint import (
+    clear_row_fingerprints,
+)
+
+
+def make_spreadsheet(sheet_key: str, worksheets: list[dict], **kwargs):
+    """Inserts a SpreadSheet mapping `worksheets`, for a sheet that doesn't exist remotely"""
+    spreadsheet = frappe.get_doc(
+        {
+            "doctype": "SpreadSheet",
+            "sheet_url": f"https://docs.google.com/spreadsheets/d/{sheet_key}/edit",
+            "worksheet_ids": worksheets,
+            **kwargs,
+        }
+    )
+    # validating the sheet reads it remotely
+    spreadsheet.validate = lambda: None
+    return spreadsheet.insert()
+
+
+def delete_spreadsheet(spreadsheet):
+    """Deletes `spreadsheet` along with its Data Imports, sync logs & the files & fingerprints of
+    its worksheets. The changes are committed, as imports commit the rows they import."""
+    for data_import in frappe.get_all(
+        "Data Import", filters={"spreadsheet_id": spreadsheet.name}, pluck="name"
+    ):
+        frappe.db.delete("Data Import Log", {"data_import": data_import})
+        frappe.delete_doc("Data Import", data_import, force=True)
+
+    for worksheet in spreadsheet.worksheet_ids:
+        for file_name in frappe.get_all(
+            "File", filters={"attached_to_name": worksheet.name}, pluck="name"
+        ):
+            frappe.delete_doc("File", file_name, force=True)
+        clear_row_fingerprints(worksheet.name)
+
+    frappe.db.delete("SpreadSheet Sync Log", {"spreadsheet": spreadsheet.name})
+    frappe.delete_doc("SpreadSheet", spreadsheet.name, force=True)
+    frappe.db.commit()
@@ -0,0 +1,132 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+import gzip
+import os
+from concurrent.futures import Executor, Future
+from csv import writer as csv_writer
+from hashlib import md5
+from io import StringIO
+from itertools import chain, islice, repeat
+from typing import Callable, Iterable, NamedTuple, Sequence
+
+import frappe
+from gspread.utils import rowcol_to_a1
+
+WRITE_BATCH_SIZE = 1_000
+
+
+class CSVFile(NamedTuple):
+    path: str
+    row_count: int
+    content_hash: str
+    file_size: int
+
+
+def write_csv_file(path: str, rows: Iterable[Sequence[str]], compress: bool = False) -> CSVFile:
+    """Streams `rows` into a csv file at `path`, `WRITE_BATCH_SIZE` rows at a time, gzipped if
+    `compress` is set. Returns the row count along with the md5 hash of the written content & the
+    size of the file."""
+    rows = iter(rows)
+    content_hash, file_size, row_count = md5(), 0, 0
+
+    with (gzip.open if compress else open)(path, "wb") as f:
+        while batch := list(islice(rows, WRITE_BATCH_SIZE)):
+            buffer = StringIO()
+            csv_writer(buffer).writerows(batch)
+            content = buffer.getvalue().encode("utf-8")
+
+            f.write(content)
+            content_hash.update(content)
+            file_size += len(content)
+            row_count += len(batch)
+
+    if compress:
+        file_size = os.path.getsize(path)
+
+    return CSVFile(path, row_count, content_hash.hexdigest(), file_size)
+
+
+def read_csv_file(path: str) -> str:
+    """Returns the content of a csv file written by `write_csv_file`, compressed or not"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def write_csv_chunks(
+    get_path: Callable[[], str],
+    header_row: Sequence[str],
+    rows: Iterable[Sequence[str]],
+    chunk_size: int,
+) -> list[CSVFile]:
+    """Streams `rows` into csv files of at most `chunk_size` rows each, every file starting with
+    `header_row`. No file is written if there are no rows."""
+    rows = iter(rows)
+    csv_files = []
+
+    while (first_row := next(rows, None)) is not None:
+        chunk = chain([header_row, first_row], islice(rows, chunk_size - 1))
+        csv_files.append(write_csv_file(get_path(), chunk))
+
+    return csv_files
+
+
+def get_column_letter(column: int) -> str:
+    return rowcol_to_a1(1, column)[:-1]
+
+
+def get_column_runs(indexes: Sequence[int]) -> list[tuple[int, int]]:
+    """Groups sorted column (or row) indexes into runs of adjacent ones, as (first, last) pairs"""
+    runs = []
+    for index in indexes:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+
+def project_row(row: Sequence[str], indexes: Sequence[int]) -> list[str]:
+    return [row[index] if index < len(row) else "" for index in indexes]
+
+
+def merge_column_ranges(
+    value_ranges: Sequence[Sequence[Sequence[str]]], widths: Sequence[int]
+) -> list[list[str]]:
+    """Joins the values of ranges over the same rows but different columns side by side. Rows &
+    cells trimmed from a range's values are filled in, up to the range's width."""
+    row_count = max((len(values) for values in value_ranges), default=0)
+    rows = [[] for _ in range(row_count)]
+
+    for values, width in zip(value_ranges, widths):
+        for row, value_row in zip(rows, chain(values, repeat([]))):
+            row.extend(value_row[:width])
+            row.extend([""] * (width - len(value_row[:width])))
+
+    return rows
+
+
+def submit_in_site(executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """Submits `fn` to a worker thread of `executor`, run for the current site & user"""
+    return executor.submit(
+        run_in_site,
+        frappe.local.site,
+        frappe.local.sites_path,
+        frappe.session.user,
+        fn,
+        *args,
+        **kwargs,
+    )
+
+
+def run_in_site(site: str, sites_path: str, user: str, fn: Callable, *args, **kwargs):
+    # runs in a worker thread, with its own site context & database connection
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    frappe.set_user(user)
+
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        frappe.destroy()
@@ -0,0 +1,142 @@
+# Copyright (c) 2023, Gavin D'souza and contributors
+# For license information, please see license.txt
+
+"""Row level change notifications of worksheets, eg: sent by an Apps Script `onEdit` trigger to
+`sheets.api.notify_changes`. Notified rows are collected in Redis per worksheet & imported by a
+single job once the notifications settle, so a burst of edits is imported together."""
+
+import time
+
+import frappe
+from frappe.utils import now_datetime
+
+from sheets.constants import WEBHOOK_DEBOUNCE, WEBHOOK_MAX_DELAY
+from sheets.profiling import SyncStats, use_sync_stats
+from sheets.sheets_workspace.doctype.spreadsheet_sync_log.spreadsheet_sync_log import (
+    create_sync_log,
+)
+from sheets.sync_state import (
+    DONE,
+    FAILED,
+    IMPORTING,
+    get_sync_lease,
+    request_sync_rerun,
+    start_sync_run,
+)
+
+WEBHOOK_SECRET_HEADER = "X-Sheets-Webhook-Secret"
+
+
+def queue_notified_rows(worksheet: str, row_numbers: list[int]):
+    cache = frappe.cache()
+    cache.sadd(get_notified_rows_key(worksheet), *row_numbers)
+    cache.set_value(get_notified_at_key(worksheet), time.time())
+    # a job queued or running already imports the rows, even ones notified as it releases its
+    # claim, see `release_notified_rows`
+    if claim_notified_rows(worksheet):
+        frappe.enqueue(import_notified_rows, worksheet=worksheet)
+
+
+def import_notified_rows(worksheet: str):
+    """Imports the rows notified for the worksheet, in batches, till none are left. Rows of a
+    failed batch aren't retried, their changes are picked up by the next scheduled sync. Rows
+    notified during a sync of the sheet are left to one more sync after it, which imports all
+    changes anyway."""
+    from sheets.sheets_workspace.doctype.doctype_worksheet_mapping.doctype_worksheet_mapping import (
+        get_worksheet,
+    )
+
+    # notifications are accepted from guests, the imports are run like scheduled ones
+    frappe.set_user("Administrator")
+
+    while True:
+        wait_for_notifications(worksheet)
+        if not (row_numbers := pop_notified_rows(worksheet)):
+            if release_notified_rows(worksheet):
+                break
+            continue
+
+        claim_notified_rows(worksheet, renew=True)
+        worksheet_doc = get_worksheet(worksheet)
+        if (sync_run := start_sync_run(worksheet_doc.parent)) is None:
+            request_sync_rerun(worksheet_doc.parent)
+            continue
+
+        stats, started_at, start = SyncStats(), now_datetime(), time.perf_counter()
+        summary = {"worksheet_id": worksheet_doc.worksheet_id, "stats": stats}
+        try:
+            sync_run.set_state(IMPORTING)
+            with use_sync_stats(stats):
+                messages = worksheet_doc.import_notified_rows(row_numbers)
+        except Exception as e:
+            sync_run.finish(FAILED)
+            frappe.db.rollback()
+            worksheet_doc.log_error("Import of notified rows failed")
+            summary.update({"status": "Failed", "error": str(e), "messages": []})
+        else:
+            sync_run.finish(DONE)
+            summary.update({"status": "Success", "error": None, "messages": messages})
+
+        # recorded like a sync, as the messages of the imports aren't shown to anyone
+        create_sync_log(
+            worksheet_doc.parent, started_at, time.perf_counter() - start, SyncStats(), [summary]
+        )
+        frappe.db.commit()
+
+
+def wait_for_notifications(worksheet: str):
+    """Waits till no rows have been notified for WEBHOOK_DEBOUNCE seconds, or WEBHOOK_MAX_DELAY
+    seconds at most"""
+    deadline = time.time() + WEBHOOK_MAX_DELAY
+
+    while (now := time.time()) < deadline:
+        # read from Redis every time, get_value keeps the first value read for the job otherwise
+        notified_at = frappe.cache().get_value(get_notified_at_key(worksheet), expires=True) or 0
+        if (quiet_for := now - notified_at) >= WEBHOOK_DEBOUNCE:
+            return
+        time.sleep(min(WEBHOOK_DEBOUNCE - quiet_for, deadline - now))
+
+
+def claim_notified_rows(worksheet: str, renew: bool = False) -> bool:
+    """Claims the import of the rows notified for the worksheet for a single job, returns False if
+    another job holds the claim. The claim of a job that died expires after the sync lease."""
+    cache = frappe.cache()
+    return bool(
+        cache.set(cache.make_key(get_claim_key(worksheet)), 1, nx=not renew, ex=get_sync_lease())
+    )
+
+
+def release_notified_rows(worksheet: str) -> bool:
+    """Releases the job's claim, returns False if rows were notified meanwhile & the job claimed
+    them again. Notifications finding the claim held before it's released are seen here, those
+    after it queue a job of their own."""
+    cache = frappe.cache()
+    cache.delete(cache.make_key(get_claim_key(worksheet)))
+    if not cache.smembers(get_notified_rows_key(worksheet)):
+        return True
+    return not claim_notified_rows(worksheet)
+
+
+def pop_notified_rows(worksheet: str) -> list[int]:
+    cache = frappe.cache()
+    key = cache.make_key(get_notified_rows_key(worksheet))
+
+    # read & cleared in a transaction, rows notified meanwhile are left for the next batch
+    pipeline = cache.pipeline()
+    pipeline.smembers(key)
+    pipeline.delete(key)
+    row_numbers, _ = pipeline.execute()
+
+    return sorted(int(x) for x in row_numbers)
+
+
+def get_notified_rows_key(worksheet: str) -> str:
+    return f"sheets:notified_rows:{worksheet}"
+
+
+def get_notified_at_key(worksheet: str) -> str:
+    return f"sheets:notified_at:{worksheet}"
+
+
+def get_claim_key(worksheet: str) -> str:
+    return f"sheets:notified_rows_claim:{worksheet}"